@@ -0,0 +1,102 @@
+import sys
+import time
+import threading
+
+
+class _TimedLoader:
+    # Wraps a module's real loader and times exec_module, everything else is passed straight through
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter()
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(module.__name__,
+                                 time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportProfiler:
+    """
+    Records how long each newly imported module takes to execute.
+
+    `cumulative` includes everything the module imported while it was loading,
+    `self` is just the module's own top level code. Enable for the cloud function
+    with the IMPORT_PROFILE env var, COLD_START_BUDGET_MS flags a cold start that goes over.
+    """
+
+    def __init__(self, budget_ms=None):
+        self.budget_ms = budget_ms
+        self.timings = []
+        self._reported = 0
+        self._local = threading.local()
+        self._installed = False
+
+    def install(self):
+        if not self._installed:
+            sys.meta_path.insert(0, self)
+            self._installed = True
+        return self
+
+    def uninstall(self):
+        if self._installed:
+            sys.meta_path.remove(self)
+            self._installed = False
+
+    def find_spec(self, fullname, path=None, target=None):
+        # Ask the rest of the meta path for the real spec and wrap its loader
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _enter(self):
+        self._stack().append(0.0)
+
+    def _exit(self, name, elapsed):
+        stack = self._stack()
+        children = stack.pop()
+        if len(stack) > 0:
+            stack[-1] += elapsed
+        self.timings.append({
+            "module": name,
+            "cumulative_ms": elapsed * 1000,
+            "self_ms": (elapsed - children) * 1000,
+            "top_level": len(stack) == 0
+        })
+
+    def report(self, label, top=25):
+        timings = self.timings[self._reported:]
+        self._reported = len(self.timings)
+
+        total_ms = sum(t["cumulative_ms"] for t in timings if t["top_level"])
+        print("Import profile - {}: {} modules in {:.1f}ms".format(
+            label, len(timings), total_ms))
+        for t in sorted(timings, key=lambda t: t["self_ms"], reverse=True)[:top]:
+            print("  {:>9.1f}ms self {:>9.1f}ms cumulative  {}".format(
+                t["self_ms"], t["cumulative_ms"], t["module"]))
+
+        if self.budget_ms is not None and total_ms > self.budget_ms:
+            print("WARNING: {} imports took {:.1f}ms, over the {:.0f}ms cold start budget".format(
+                label, total_ms, self.budget_ms))
+
+        return total_ms
@@ -0,0 +1,70 @@
+import io
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+
+# Other names clients send for the same thing
+MIMETYPES = {
+    ARROW_STREAM: ARROW_STREAM,
+    "application/vnd.apache.arrow.file": ARROW_STREAM,
+    PARQUET: PARQUET,
+    "application/x-parquet": PARQUET,
+    "application/parquet": PARQUET,
+}
+
+
+def available():
+    # pyarrow is only imported once a binary format is asked for, it's slow to load on a cold start
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate(accept):
+    """
+    The binary format named in an Accept header, None means JSON.
+    Only formats that are asked for by name count, so */* still gets JSON.
+    """
+    if not accept:
+        return None
+
+    best = None
+    best_q = 0.0
+    for part in accept.split(","):
+        pieces = part.strip().split(";")
+        mimetype = MIMETYPES.get(pieces[0].strip().lower())
+        if mimetype is None:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best = mimetype
+            best_q = q
+    return best
+
+
+def encode(df, mimetype):
+    # The DataFrame's columns go straight into Arrow buffers, rows are never built
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+
+    if mimetype == ARROW_STREAM:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    elif mimetype == PARQUET:
+        pq.write_table(table, sink)
+    else:
+        raise ValueError("Unsupported format " + str(mimetype))
+
+    return sink.getvalue()
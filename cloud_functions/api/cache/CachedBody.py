@@ -0,0 +1,98 @@
+import hashlib
+import json
+import sys
+from ..compression import compress_variants
+
+DATA_PREFIX = b'{"data": '
+FROM_CACHE_SUFFIX = b', "fromCache": true}'
+NOT_FROM_CACHE_SUFFIX = b', "fromCache": false}'
+
+
+def body_etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def etag_matches(if_none_match, etag):
+    # Weak comparison, as If-None-Match requires, against any encoding of the same data
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in tags:
+        return True
+    for tag in tags:
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"').split("-")[0] == etag:
+            return True
+    return False
+
+
+class CachedBody:
+    """
+    A response body encoded once, when it is stored.
+
+    `body` is the exact bytes of json.dumps({"data": data, "fromCache": True}), so a cache hit
+    returns it untouched. The fromCache flag always sits at the very end of the document,
+    so the first (uncached) response is a cheap splice of the same bytes instead of a re-encode.
+
+    The ETag is a weak validator, a hash of the encoded data alone, so it doesn't change with the fromCache flag.
+    `expires` is when data cached with its own TTL goes stale, None if it never does.
+    """
+    __slots__ = ("body", "variants", "etag", "expires")
+
+    def __init__(self, data):
+        self._encode(json.dumps(data).encode("utf-8"))
+
+    @classmethod
+    def from_encoded(cls, encoded):
+        # For data that is already JSON, e.g. several cached bodies joined together
+        entry = cls.__new__(cls)
+        entry._encode(encoded)
+        return entry
+
+    def _encode(self, encoded):
+        self.body = DATA_PREFIX + encoded + FROM_CACHE_SUFFIX
+        self.expires = None
+        # Content-Encoding -> compressed copy of body
+        self.variants = {}
+        self.etag = body_etag(
+            memoryview(self.body)[len(DATA_PREFIX):-len(FROM_CACHE_SUFFIX)])
+
+    def etag_for(self, encoding):
+        # Each Content-Encoding is a different representation, so gets its own tag.
+        # Weak, as the bytes sent differ in the fromCache flag
+        if encoding is None:
+            return 'W/"' + self.etag + '"'
+        return 'W/"' + self.etag + "-" + encoding + '"'
+
+    def matches(self, if_none_match):
+        return etag_matches(if_none_match, self.etag)
+
+    def precompress(self):
+        self.variants = compress_variants(self.body)
+        return self
+
+    def encoded(self, encoding):
+        # The cached body in the requested encoding, None if it isn't stored that way
+        if encoding is None:
+            return self.body
+        return self.variants.get(encoding)
+
+    def render(self, fromCache):
+        if fromCache:
+            return self.body
+        return self.body[:-len(FROM_CACHE_SUFFIX)] + NOT_FROM_CACHE_SUFFIX
+
+    @property
+    def data(self):
+        # The encoded "data" member on its own
+        return self.body[len(DATA_PREFIX):-len(FROM_CACHE_SUFFIX)]
+
+    @property
+    def size(self):
+        return sys.getsizeof(self)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self.body) + \
+            sys.getsizeof(self.variants) + \
+            sum(sys.getsizeof(v) for v in self.variants.values())
@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+
+
+class FileVersionStore:
+    # One file per utility holding its version, for running locally
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, utility):
+        return os.path.join(self.directory, utility)
+
+    def read(self, utility):
+        try:
+            with open(self._path(utility)) as f:
+                return int(f.read())
+        except FileNotFoundError:
+            return 0
+
+    def write(self, utility, version):
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = self._path(utility) + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(str(version))
+        os.replace(temporary, self._path(utility))
+
+
+class BlobVersionStore:
+    # One blob per utility in the scraper's bucket, data_versions/<utility>
+    def __init__(self, bucket_name, prefix="data_versions/"):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            from google.cloud import storage
+            self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def read(self, utility):
+        from google.api_core.exceptions import NotFound
+        try:
+            return int(self.bucket.blob(self.prefix + utility).download_as_string())
+        except NotFound:
+            return 0
+
+    def write(self, utility, version):
+        self.bucket.blob(self.prefix + utility).upload_from_string(str(version))
+
+
+class DataVersions:
+    """
+    The version of each utility's data, published by the scraper whenever new data lands.
+
+    Cache keys end with the version, so entries never need to expire on a guess,
+    the first request after new data just misses. The store is read at most every
+    `check_seconds` for each utility, the rest of the time the last version read is used.
+    Without a store every version is 0 and keys are left as they are.
+    """
+
+    def __init__(self, store=None, check_seconds=60, clock=time.monotonic):
+        self.store = store
+        self.check_seconds = check_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        # utility -> (version, next_check)
+        self._versions = {}
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    def get(self, utility):
+        if self.store is None:
+            return 0
+
+        with self._lock:
+            known = self._versions.get(utility)
+        if known is not None and self._clock() < known[1]:
+            return known[0]
+
+        try:
+            version = self.store.read(utility)
+        except Exception as e:
+            print("Couldn't check the data version of {}: {}".format(utility, e))
+            # Entries made while the store can't be read aren't kept once it can be again
+            version = -1 if known is None else known[0]
+
+        with self._lock:
+            # Never go back to an older version if a slower read finishes last
+            if known is not None:
+                version = max(version, self._versions[utility][0])
+            self._versions[utility] = (
+                version, self._clock() + self.check_seconds)
+        return version
+
+    def key(self, key):
+        # (utility, entry_class, *parts) -> (utility, entry_class, *parts, version)
+        if self.store is None:
+            return key
+        return key + (self.get(key[0]),)
+
+    def publish(self, utility):
+        """
+        Move a utility on to a new version, always higher than the last.
+        Milliseconds since the epoch when the clock allows, so versions are never reused after a reset.
+        """
+        if self.store is None:
+            return 0
+        version = max(self.store.read(utility) + 1, int(time.time() * 1000))
+        self.store.write(utility, version)
+        with self._lock:
+            self._versions[utility] = (version, self._clock() + self.check_seconds)
+        print("Published data version {} for {}".format(version, utility))
+        return version
+
+
+def create_version_store(store, stage):
+    # "none", "blob" for the scraper's Cloud Storage bucket, or "file:<directory>"
+    if store == "none":
+        return None
+    if store == "blob":
+        return BlobVersionStore("scraper_data_" + stage)
+    if store.startswith("file:"):
+        return FileVersionStore(store[len("file:"):])
+    raise ValueError("Unknown data version store " + store)
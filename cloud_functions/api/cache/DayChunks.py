@@ -0,0 +1,63 @@
+import pandas as pd
+from datetime import datetime, timedelta
+
+
+def days_in_range(from_date, to_date):
+    start = datetime.strptime(from_date, '%Y-%m-%d').date()
+    end = datetime.strptime(to_date, '%Y-%m-%d').date()
+    return [(start + timedelta(days=n)).isoformat() for n in range((end - start).days + 1)]
+
+
+def is_contiguous(days):
+    first = datetime.strptime(days[0], '%Y-%m-%d').date()
+    last = datetime.strptime(days[-1], '%Y-%m-%d').date()
+    return (last - first).days + 1 == len(days)
+
+
+def day_keys(timestamps):
+    # Dates are compared in UTC, the same as EXTRACT(DATE from ...) in BigQuery
+    return pd.to_datetime(timestamps, utc=True).dt.strftime('%Y-%m-%d')
+
+
+def fetch_by_day(cache, key_prefix, from_date, to_date, query_days, timestamp_column, ttl=None):
+    """
+    Build a date range from per-day chunks in the cache.
+
+    Days that are missing are fetched together with a single call to
+    query_days(missing_days), split up by day and cached for the next request.
+    Days with no data are cached as empty chunks so they are not asked for again.
+    ttl(day, df) gives how long each day can be cached for, with df everything that was fetched,
+    without it the cache's TTL for the entry class is used.
+    """
+    days = days_in_range(from_date, to_date)
+
+    chunks = {}
+    missing = []
+    for day in days:
+        chunk = cache.get(key_prefix + (day,))
+        if chunk is None:
+            missing.append(day)
+        else:
+            chunks[day] = chunk
+
+    if len(missing) > 0:
+        print("Fetching {} of {} days for {}".format(
+            len(missing), len(days), key_prefix))
+        df = query_days(missing)
+
+        if len(df.index) > 0:
+            grouped = dict(iter(df.groupby(
+                day_keys(df[timestamp_column]).values, sort=False)))
+        else:
+            grouped = {}
+
+        empty = df.iloc[0:0]
+        for day in missing:
+            chunk = grouped.get(day, empty).reset_index(drop=True)
+            if ttl is None:
+                cache.set(key_prefix + (day,), chunk)
+            else:
+                cache.set(key_prefix + (day,), chunk, ttl=ttl(day, df))
+            chunks[day] = chunk
+
+    return pd.concat([chunks[day] for day in days], ignore_index=True)
@@ -0,0 +1,68 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+# Days after which the utilities no longer revise their data, anything older never changes
+IMMUTABLE_AFTER_DAYS = int(os.environ.get("CACHE_IMMUTABLE_AFTER_DAYS", 7))
+# Seconds that data from the last IMMUTABLE_AFTER_DAYS can be cached for
+RECENT_TTL = int(os.environ.get("CACHE_RECENT_TTL", 15 * 60))
+# How often a new forecast is made, it replaces the last one
+FORECAST_INTERVAL = int(os.environ.get("FORECAST_INTERVAL", 24 * 60 * 60))
+# A forecast that's overdue is checked for this often
+FORECAST_MIN_TTL = int(os.environ.get("FORECAST_MIN_TTL", 5 * 60))
+
+# What an HTTP cache can do with data that never changes
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def _utc_now():
+    return datetime.now(timezone.utc)
+
+
+def is_immutable(last_day, now=None):
+    # last_day is a YYYY-MM-DD string, dates are in UTC the same as the data
+    now = now or _utc_now()
+    last = datetime.strptime(last_day, '%Y-%m-%d').date()
+    return last < now.date() - timedelta(days=IMMUTABLE_AFTER_DAYS)
+
+
+def range_ttl(last_day, now=None):
+    """
+    Seconds to cache a range of data ending on last_day for, None when it will never change.
+    """
+    if is_immutable(last_day, now):
+        return None
+    return RECENT_TTL
+
+
+def forecast_ttl(date_created, now=None):
+    """
+    Seconds until the forecast made at date_created (the latest one) is replaced by the next,
+    going by FORECAST_INTERVAL. None or NaT when there's no forecast yet.
+    """
+    import pandas as pd
+
+    if date_created is None or pd.isnull(date_created):
+        return FORECAST_MIN_TTL
+    now = now or _utc_now()
+    created = pd.Timestamp(date_created)
+    if created.tzinfo is None:
+        created = created.tz_localize("UTC")
+    next_forecast = created + pd.Timedelta(seconds=FORECAST_INTERVAL)
+    return max(int((next_forecast - pd.Timestamp(now)).total_seconds()), FORECAST_MIN_TTL)
+
+
+def expiry(ttl):
+    # When something cached for ttl seconds from now expires, None never
+    return None if ttl is None else time.time() + ttl
+
+
+def remaining(expires):
+    # Seconds left until expires, what an HTTP cache can still be told
+    return None if expires is None else max(int(expires - time.time()), 0)
+
+
+def shortest(ttls):
+    # The TTL for something made of several entries, None only if none of them ever change
+    ttls = [ttl for ttl in ttls if ttl is not None]
+    return min(ttls) if len(ttls) > 0 else None
@@ -0,0 +1,138 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# set() without a ttl uses the TTL of the key's entry class
+ENTRY_CLASS_TTL = object()
+
+
+def estimate_size(value, _seen=None):
+    # Rough deep size of a cached value in bytes
+    # containers are walked, everything else trusts __sizeof__ (pandas objects report their deep usage)
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += estimate_size(k, _seen) + estimate_size(v, _seen)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for v in value:
+            size += estimate_size(v, _seen)
+    return size
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache with a byte budget and per entry class TTLs.
+
+    Keys are tuples of (utility, entry_class, *parts) so a utility can be cleared in one go
+    and the TTL is looked up from the entry class, unless set() is given one for that entry.
+    A TTL of None means the entry never expires.
+    """
+
+    def __init__(self, max_bytes, ttls=None, default_ttl=None, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self._clock = clock
+        self._lock = threading.RLock()
+        # key -> (value, size, expires_at)
+        self._entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejections = 0
+
+    def _ttl_for(self, key):
+        entry_class = key[1] if isinstance(key, tuple) and len(key) > 1 else None
+        return self.ttls.get(entry_class, self.default_ttl)
+
+    def _remove(self, key):
+        value, size, expires_at = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=None, ttl=ENTRY_CLASS_TTL):
+        if size is None:
+            size = estimate_size(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            # Never let a single entry flush the whole cache
+            if size > self.max_bytes:
+                self.rejections += 1
+                return False
+
+            if ttl is ENTRY_CLASS_TTL:
+                ttl = self._ttl_for(key)
+            expires_at = None if ttl is None else self._clock() + ttl
+            self._entries[key] = (value, size, expires_at)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self, utility=None):
+        with self._lock:
+            if utility is None:
+                self._entries.clear()
+                self.current_bytes = 0
+                return
+            for key in [k for k in self._entries if k[0] == utility]:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "rejections": self.rejections
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[2] is None or entry[2] > self._clock())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
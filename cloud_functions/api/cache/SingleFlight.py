@@ -0,0 +1,81 @@
+import threading
+
+
+class SingleFlightTimeout(TimeoutError):
+    '''Raised to a waiting caller when the in-flight call it joined takes too long'''
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the function, anyone arriving while it is still running
+    waits for that result (or exception) instead of running their own copy.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def do(self, key, fn, timeout=None):
+        """
+        Returns (result, executed), executed is True only for the caller that actually ran fn
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result, True
+
+        print("Coalesced request for {}".format(key))
+        if not call.done.wait(self.timeout if timeout is None else timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise SingleFlightTimeout(
+                "Timed out waiting for in-flight call {}".format(key))
+
+        if call.error is not None:
+            raise call.error
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "timeouts": self.timeouts
+            }
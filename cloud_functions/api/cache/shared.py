@@ -0,0 +1,43 @@
+import os
+from .ResponseCache import ResponseCache
+from .SingleFlight import SingleFlight
+from .DataVersions import DataVersions, create_version_store
+
+# Process wide cache shared by the routes and the utility classes
+# Instances run at 128MB, so the cache is bounded by an approximate byte budget
+CACHE_MAX_BYTES = int(os.environ.get("API_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Seconds each class of entry can live for - None never expires
+CACHE_TTLS = {
+    "historical_intensity": 6 * 60 * 60,
+    "historic_day": 6 * 60 * 60,
+    "daily_intensity": 24 * 60 * 60,
+    "daily_intensity_by": 24 * 60 * 60,
+    "intensity_cube": 24 * 60 * 60,
+    "prediction_year": 24 * 60 * 60,
+    "prediction": 60 * 60,
+    "forecast_day": 60 * 60,
+}
+
+# Where the scraper publishes each utility's data version, "none" to rely on the TTLs alone
+DATA_VERSION_STORE = os.environ.get("DATA_VERSION_STORE", "none")
+DATA_VERSION_CHECK_SECONDS = float(
+    os.environ.get("DATA_VERSION_CHECK_SECONDS", 60))
+
+data_versions = DataVersions(
+    create_version_store(DATA_VERSION_STORE, os.environ.get("STAGE")),
+    check_seconds=DATA_VERSION_CHECK_SECONDS
+)
+
+# Entries for scraped data are keyed by its version, so with versions they can be kept until evicted
+VERSIONED_ENTRIES = ("historical_intensity", "historic_day", "daily_intensity",
+                     "daily_intensity_by", "intensity_cube", "prediction", "forecast_day")
+if data_versions.enabled:
+    CACHE_TTLS = dict(CACHE_TTLS, **{entry: None for entry in VERSIONED_ENTRIES})
+
+response_cache = ResponseCache(CACHE_MAX_BYTES, ttls=CACHE_TTLS)
+
+# Concurrent misses for the same cache key wait on one query rather than running their own
+SINGLE_FLIGHT_TIMEOUT = float(os.environ.get("SINGLE_FLIGHT_TIMEOUT", 90))
+
+single_flight = SingleFlight(timeout=SINGLE_FLIGHT_TIMEOUT)
@@ -0,0 +1,52 @@
+import json
+from .CachedBody import CachedBody
+
+
+def test_body_matches_json_dumps():
+    data = {"historic": [{"timestamp": "2020-11-01 00:00:00", "carbon_intensity": 500.5}]}
+    entry = CachedBody(data)
+
+    assert entry.body == json.dumps(
+        {"data": data, "fromCache": True}).encode()
+    assert entry.render(fromCache=False) == json.dumps(
+        {"data": data, "fromCache": False}).encode()
+
+
+def test_cache_hit_is_the_stored_bytes():
+    entry = CachedBody("xyz")
+
+    assert entry.render(fromCache=True) is entry.body
+
+
+def test_data_slice():
+    entry = CachedBody({"a": [1, 2, 3]})
+
+    assert json.loads(entry.data) == {"a": [1, 2, 3]}
+
+
+def test_size_counts_body():
+    entry = CachedBody("x" * 10000)
+
+    assert entry.size > 10000
+
+
+def test_etag_ignores_from_cache_flag():
+    first = CachedBody({"a": 1})
+    same = CachedBody({"a": 1})
+    different = CachedBody({"a": 2})
+
+    assert first.etag == same.etag
+    assert first.etag != different.etag
+    assert first.etag_for(None) == 'W/"' + first.etag + '"'
+    assert first.etag_for("gzip") == 'W/"' + first.etag + '-gzip"'
+
+
+def test_etag_matches():
+    entry = CachedBody({"a": 1})
+
+    assert entry.matches(entry.etag_for(None))
+    assert entry.matches('"other", ' + entry.etag_for("br"))
+    assert entry.matches('"' + entry.etag + '-gzip"')
+    assert entry.matches("*")
+    assert not entry.matches('"other"')
+    assert not entry.matches(None)
@@ -0,0 +1,58 @@
+from .DataVersions import DataVersions, FileVersionStore, create_version_store
+
+
+class BrokenStore:
+    def read(self, utility):
+        raise IOError("unreachable")
+
+
+def test_disabled_versions_leave_keys_alone():
+    versions = DataVersions()
+
+    assert versions.key(("tepco", "daily_intensity")) == ("tepco", "daily_intensity")
+    assert versions.publish("tepco") == 0
+    assert create_version_store("none", "staging") is None
+
+
+def test_key_ends_with_the_published_version(tmp_path):
+    versions = DataVersions(FileVersionStore(str(tmp_path)))
+
+    assert versions.key(("tepco", "daily_intensity")) == ("tepco", "daily_intensity", 0)
+    version = versions.publish("tepco")
+
+    assert versions.key(("tepco", "historic_day")) == ("tepco", "historic_day", version)
+    assert versions.get("kepco") == 0
+
+
+def test_versions_only_go_up(tmp_path):
+    store = FileVersionStore(str(tmp_path))
+    store.write("tepco", 10 ** 15)
+    versions = DataVersions(store)
+
+    first = versions.publish("tepco")
+    second = versions.publish("tepco")
+
+    assert 10 ** 15 < first < second
+
+
+def test_store_is_read_once_per_check(tmp_path, clock):
+    store = FileVersionStore(str(tmp_path))
+    api = DataVersions(store, check_seconds=60, clock=clock)
+    scraper = DataVersions(store)
+
+    assert api.get("tepco") == 0
+    version = scraper.publish("tepco")
+    assert api.get("tepco") == 0
+
+    clock.now = 61
+    assert api.get("tepco") == version
+
+
+def test_unreadable_store_keeps_the_last_version(clock):
+    versions = DataVersions(BrokenStore(), check_seconds=60, clock=clock)
+
+    assert versions.get("tepco") == -1
+
+    versions._versions["tepco"] = (5, 0)
+    clock.now = 61
+    assert versions.get("tepco") == 5
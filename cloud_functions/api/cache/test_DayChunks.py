@@ -0,0 +1,64 @@
+import pandas as pd
+from .ResponseCache import ResponseCache
+from .DayChunks import days_in_range, is_contiguous, fetch_by_day
+
+
+def hourly_frame(days):
+    timestamps = []
+    for day in days:
+        timestamps += [day + " {:02d}:00:00+00:00".format(h) for h in range(2)]
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime(timestamps),
+        "carbon_intensity": range(len(timestamps))
+    })
+
+
+def test_days_in_range():
+    assert days_in_range("2020-01-30", "2020-02-02") == [
+        "2020-01-30", "2020-01-31", "2020-02-01", "2020-02-02"]
+
+
+def test_is_contiguous():
+    assert is_contiguous(["2020-01-01", "2020-01-02", "2020-01-03"])
+    assert not is_contiguous(["2020-01-01", "2020-01-03"])
+
+
+def test_overlapping_range_only_fetches_missing_days():
+    cache = ResponseCache(10 * 1024 * 1024)
+    calls = []
+
+    def query_days(days):
+        calls.append(days)
+        return hourly_frame(days)
+
+    fetch_by_day(cache, ("tepco", "historic_day"),
+                 "2020-01-01", "2020-01-03", query_days, "timestamp")
+    fetch_by_day(cache, ("tepco", "historic_day"),
+                 "2020-01-02", "2020-01-02", query_days, "timestamp")
+    df = fetch_by_day(cache, ("tepco", "historic_day"),
+                      "2019-12-31", "2020-01-05", query_days, "timestamp")
+
+    assert calls == [
+        ["2020-01-01", "2020-01-02", "2020-01-03"],
+        ["2019-12-31", "2020-01-04", "2020-01-05"]
+    ]
+    assert len(df.index) == 12
+    assert df["timestamp"].is_monotonic_increasing
+
+
+def test_empty_days_are_cached():
+    cache = ResponseCache(10 * 1024 * 1024)
+    calls = []
+
+    def query_days(days):
+        calls.append(days)
+        return hourly_frame([])
+
+    df = fetch_by_day(cache, ("tepco", "historic_day"),
+                      "2020-01-01", "2020-01-02", query_days, "timestamp")
+    fetch_by_day(cache, ("tepco", "historic_day"),
+                 "2020-01-01", "2020-01-02", query_days, "timestamp")
+
+    assert len(calls) == 1
+    assert len(df.index) == 0
+    assert list(df.columns) == ["timestamp", "carbon_intensity"]
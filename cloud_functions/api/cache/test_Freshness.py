@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+import pandas as pd
+from .Freshness import (is_immutable, range_ttl, forecast_ttl, shortest,
+                        RECENT_TTL, FORECAST_MIN_TTL)
+
+NOW = datetime(2020, 6, 15, 12, tzinfo=timezone.utc)
+
+
+def test_old_ranges_are_immutable():
+    assert is_immutable("2020-06-01", NOW)
+    assert range_ttl("2020-06-01", NOW) is None
+
+
+def test_recent_ranges_expire():
+    assert not is_immutable("2020-06-10", NOW)
+    assert range_ttl("2020-06-15", NOW) == RECENT_TTL
+
+
+def test_forecast_cached_until_the_next_one():
+    # Made at midnight, the next one is due at midnight tomorrow
+    assert forecast_ttl(pd.Timestamp("2020-06-15 00:00:00"), NOW) == 12 * 60 * 60
+    assert forecast_ttl(pd.Timestamp(
+        "2020-06-15 09:00:00+09:00"), NOW) == 12 * 60 * 60
+
+
+def test_overdue_or_missing_forecast_checked_often():
+    assert forecast_ttl(pd.Timestamp("2020-06-13"), NOW) == FORECAST_MIN_TTL
+    assert forecast_ttl(None, NOW) == FORECAST_MIN_TTL
+    assert forecast_ttl(pd.NaT, NOW) == FORECAST_MIN_TTL
+
+
+def test_shortest():
+    assert shortest([None, 60, 30]) == 30
+    assert shortest([None, None]) is None
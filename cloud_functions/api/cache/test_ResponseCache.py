@@ -0,0 +1,104 @@
+import threading
+from .ResponseCache import ResponseCache, estimate_size
+
+
+def test_get_and_set():
+    cache = ResponseCache(1000)
+
+    assert cache.get(("tepco", "daily_intensity")) is None
+    cache.set(("tepco", "daily_intensity"), "xyz", size=10)
+
+    assert cache.get(("tepco", "daily_intensity")) == "xyz"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_eviction_by_bytes():
+    cache = ResponseCache(30)
+
+    cache.set(("tepco", "a"), 1, size=10)
+    cache.set(("tepco", "b"), 2, size=10)
+    cache.set(("tepco", "c"), 3, size=10)
+
+    # Touch a so b is the least recently used
+    cache.get(("tepco", "a"))
+    cache.set(("tepco", "d"), 4, size=10)
+
+    assert ("tepco", "b") not in cache
+    assert cache.get(("tepco", "a")) == 1
+    assert cache.get(("tepco", "d")) == 4
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 30
+
+
+def test_oversized_entry_rejected():
+    cache = ResponseCache(10)
+
+    assert cache.set(("tepco", "a"), "big", size=11) is False
+    assert len(cache) == 0
+    assert cache.stats()["rejections"] == 1
+
+
+def test_ttl_per_entry_class(clock):
+    cache = ResponseCache(1000, ttls={"prediction": 60}, clock=clock)
+
+    cache.set(("tepco", "prediction", "2020-01-01"), "forecast", size=1)
+    cache.set(("tepco", "daily_intensity"), "average", size=1)
+
+    clock.now = 61
+
+    assert cache.get(("tepco", "prediction", "2020-01-01")) is None
+    assert cache.get(("tepco", "daily_intensity")) == "average"
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["bytes"] == 1
+
+
+def test_ttl_per_entry(clock):
+    cache = ResponseCache(1000, ttls={"historic_day": 60}, clock=clock)
+
+    cache.set(("tepco", "historic_day", "2020-01-01"), "old", size=1, ttl=None)
+    cache.set(("tepco", "historic_day", "2020-01-02"), "recent", size=1, ttl=10)
+
+    clock.now = 11
+    assert cache.get(("tepco", "historic_day", "2020-01-02")) is None
+
+    clock.now = 10 ** 6
+    assert cache.get(("tepco", "historic_day", "2020-01-01")) == "old"
+
+
+def test_clear_utility():
+    cache = ResponseCache(1000)
+
+    cache.set(("tepco", "daily_intensity"), 1, size=1)
+    cache.set(("kepco", "daily_intensity"), 2, size=1)
+    cache.clear("tepco")
+
+    assert ("tepco", "daily_intensity") not in cache
+    assert cache.get(("kepco", "daily_intensity")) == 2
+    assert cache.stats()["bytes"] == 1
+
+
+def test_estimate_size_is_deep():
+    shallow = estimate_size({"data": None})
+    deep = estimate_size({"data": ["x" * 1000]})
+
+    assert deep > shallow + 1000
+
+
+def test_concurrent_access():
+    cache = ResponseCache(500)
+
+    def worker(n):
+        for i in range(200):
+            cache.set(("tepco", "historical_intensity", n, i), i, size=7)
+            cache.get(("tepco", "historical_intensity", n, i))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 500
+    assert stats["bytes"] == stats["entries"] * 7
@@ -0,0 +1,105 @@
+import pytest
+import threading
+import time
+from .SingleFlight import SingleFlight, SingleFlightTimeout
+
+
+def run_concurrently(n, target):
+    results = [None] * n
+    errors = [None] * n
+
+    def worker(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_single_call():
+    flight = SingleFlight()
+
+    assert flight.do("key", lambda: 42) == (42, True)
+    assert flight.stats()["executions"] == 1
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight(timeout=5)
+    release = threading.Event()
+    calls = []
+
+    def slow_query():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    def request():
+        return flight.do("tepco", slow_query)
+
+    def release_when_waiting():
+        while flight.stats()["coalesced"] < 4:
+            time.sleep(0.001)
+        release.set()
+
+    threading.Thread(target=release_when_waiting).start()
+    results, errors = run_concurrently(5, request)
+
+    assert len(calls) == 1
+    assert errors == [None] * 5
+    assert sorted(executed for result, executed in results) == [
+        False, False, False, False, True]
+    assert all(result == "result" for result, executed in results)
+    assert flight.stats()["coalesced"] == 4
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_errors_propagate_to_all_waiters():
+    flight = SingleFlight(timeout=5)
+    release = threading.Event()
+
+    def failing_query():
+        release.wait(5)
+        raise ValueError("BigQuery said no")
+
+    def release_when_waiting():
+        while flight.stats()["coalesced"] < 2:
+            time.sleep(0.001)
+        release.set()
+
+    threading.Thread(target=release_when_waiting).start()
+    results, errors = run_concurrently(
+        3, lambda: flight.do("tepco", failing_query))
+
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert flight.stats()["errors"] == 1
+
+    # The failed call is not remembered
+    assert flight.do("tepco", lambda: "ok") == ("ok", True)
+
+
+def test_waiter_timeout():
+    flight = SingleFlight(timeout=0.01)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_query():
+        started.set()
+        release.wait(5)
+        return "late"
+
+    leader = threading.Thread(target=lambda: flight.do("tepco", slow_query))
+    leader.start()
+    started.wait(5)
+
+    with pytest.raises(SingleFlightTimeout):
+        flight.do("tepco", slow_query)
+
+    release.set()
+    leader.join()
+    assert flight.stats()["timeouts"] == 1
@@ -0,0 +1,73 @@
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Small bodies aren't worth the CPU or the extra headers
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# In order of preference when a client accepts several equally
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _gzip(body):
+    # zlib rather than gzip.compress so the header carries no timestamp and output is repeatable
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def compress(body, encoding):
+    if encoding == "gzip":
+        return _gzip(body)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    raise ValueError("Unsupported encoding " + str(encoding))
+
+
+def should_compress(body):
+    return len(body) >= COMPRESSION_MIN_BYTES
+
+
+def compress_variants(body):
+    # Every encoding we can serve, computed once for a cached body
+    if not should_compress(body):
+        return {}
+    return {encoding: compress(body, encoding) for encoding in SUPPORTED_ENCODINGS}
+
+
+def negotiate(accept_encoding):
+    """
+    Picks the encoding to use from an Accept-Encoding header, None means send it as-is
+    """
+    if not accept_encoding:
+        return None
+
+    qualities = {}
+    for part in accept_encoding.split(","):
+        pieces = part.strip().split(";")
+        coding = pieces[0].strip().lower()
+        if coding == "":
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding] = q
+
+    best = None
+    best_q = 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = qualities.get(encoding, qualities.get("*", 0.0))
+        if q > best_q:
+            best = encoding
+            best_q = q
+    return best
@@ -0,0 +1,17 @@
+import pytest
+
+
+class FakeClock:
+    # Stands in for time.monotonic/perf_counter, moves on by `step` every time it's read
+    def __init__(self, step=0):
+        self.now = 0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
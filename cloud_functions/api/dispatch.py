@@ -0,0 +1,25 @@
+from flask.ctx import RequestContext
+
+
+def dispatch(app, request):
+    """
+    Runs a request from the functions framework straight through a Flask app's routes.
+
+    The incoming request is already a parsed Flask request, so it is pushed as the
+    request context as-is rather than copying its headers and body into a test context.
+    """
+    # Unwrap the flask.request proxy, it would resolve to our own context once pushed
+    if hasattr(request, "_get_current_object"):
+        request = request._get_current_object()
+    if not isinstance(request, app.request_class):
+        request = app.request_class(request.environ)
+
+    # Any routing the framework did against its own app doesn't apply to ours
+    request.routing_exception = None
+
+    ctx = RequestContext(app, request.environ, request=request)
+    ctx.push()
+    try:
+        return app.full_dispatch_request()
+    finally:
+        ctx.pop()
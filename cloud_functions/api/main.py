@@ -1,24 +1,22 @@
 import json
-import copy
-import werkzeug.datastructures
-from flask import Flask
+import os
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, has_request_context, stream_with_context
 from datetime import datetime
-import re
 now = datetime.now()
 app = Flask(__name__)
 
-from pprint import pprint
-
-from .utilities.tepco.TepcoAPI import TepcoAPI
-from .utilities.tohokuden.TohokudenAPI import TohokudenAPI
-from .utilities.kepco.KepcoAPI import KepcoAPI
-from .utilities.chuden.ChudenAPI import ChudenAPI
-from .utilities.hepco.HepcoAPI import HepcoAPI
-from .utilities.rikuden.RikudenAPI import RikudenAPI
-from .utilities.cepco.CepcoAPI import CepcoAPI
-from .utilities.yonden.YondenAPI import YondenAPI
-from .utilities.kyuden.KyudenAPI import KyudenAPI
-from .utilities.okiden.OkidenAPI import OkidenAPI
+from .utilities.UtilityRegistry import utility_apis, UTILITIES
+from .cache.shared import response_cache, single_flight, data_versions
+from .cache.Freshness import range_ttl, expiry, remaining, shortest, IMMUTABLE_MAX_AGE
+from .cache.SingleFlight import SingleFlightTimeout
+from .utilities.QueryBackend import UnsupportedQuery
+from .cache.CachedBody import CachedBody, body_etag, etag_matches
+from .cache.ResponseCache import ENTRY_CLASS_TTL
+from .dispatch import dispatch
+from .compression import negotiate, compress, should_compress
+from .utilities.layouts import LAYOUTS, TIMESTAMP_FORMATS
+from . import arrow_formats
 
 
 def generate_standard_error_model(message, code):
@@ -34,6 +32,14 @@ BAD_BREAKDOWN = generate_standard_error_model(
     'Invalid Breakdown Specified', 400)
 BAD_YEAR = generate_standard_error_model(
     'Invalid Year Specified - must be between this year and 50 from now', 400)
+DATA_TIMEOUT = generate_standard_error_model(
+    'Timed out waiting for data', 504)
+FORMAT_UNAVAILABLE = generate_standard_error_model(
+    'Arrow and Parquet output is not available', 406)
+BAD_LAYOUT = generate_standard_error_model(
+    'Invalid Layout Specified - layout must be records or columnar, timestamps iso, epoch or step', 400)
+UNSUPPORTED_QUERY = generate_standard_error_model(
+    'Not available from this deployment\'s query backend', 501)
 
 
 # Add CORS to All Requests
@@ -44,39 +50,254 @@ headers = {
 }
 
 
-cache = {
-    "tepco": {},
-    "tohokuden": {},
-    "kepco": {},
-    "chuden": {},
-    "hepco": {},
-    "rikuden": {},
-    "cepco": {},
-    "yonden": {},
-    "kyuden": {},
-    "okiden": {},
+# Browser and proxy caching for each class of cache entry - (max-age, stale-while-revalidate) in seconds
+#   averages and model predictions only change when the scraper runs, historic data gains an hour at a time
+CACHE_CONTROL = {
+    "historical_intensity": (60 * 60, 24 * 60 * 60),
+    "daily_intensity": (6 * 60 * 60, 24 * 60 * 60),
+    "daily_intensity_by": (6 * 60 * 60, 24 * 60 * 60),
+    "prediction_year": (24 * 60 * 60, 7 * 24 * 60 * 60),
+    "prediction": (30 * 60, 60 * 60),
 }
 
 
+def cacheControl(entryClass, ttl=ENTRY_CLASS_TTL):
+    # Entries with their own TTL are fresh for as long as they're cached, None never changes
+    if ttl is None:
+        return "public, max-age={}, immutable".format(IMMUTABLE_MAX_AGE)
+    maxAge, staleWhileRevalidate = CACHE_CONTROL[entryClass]
+    if ttl is not ENTRY_CLASS_TTL:
+        maxAge = ttl
+        staleWhileRevalidate = min(staleWhileRevalidate, ttl)
+    return "public, max-age={}, stale-while-revalidate={}".format(maxAge, staleWhileRevalidate)
+
+
+cache = response_cache
+
+
 def clearCache(utility):
     # Mainly Used for the Test Framework
-    cache[utility] = {}
+    cache.clear(utility)
+
+
+def requestHeader(name):
+    # Routes are also called directly (e.g. from the tests) with no request around them
+    if not has_request_context():
+        return None
+    return request.headers.get(name)
+
+
+def requestArg(name):
+    if not has_request_context():
+        return None
+    return request.args.get(name)
+
+
+def requestLayout():
+    # ?layout=columnar&timestamps=epoch, None if either isn't one we know
+    layout = requestArg("layout") or "records"
+    timestamps = requestArg("timestamps") or "iso"
+    if layout not in LAYOUTS or timestamps not in TIMESTAMP_FORMATS:
+        return None
+    return layout, timestamps
+
+
+def layoutKey(layout, timestamps):
+    # The default layout keeps the plain cache key
+    if layout == "records":
+        return ()
+    return (layout, timestamps)
+
+
+def ndjsonResponse(rows):
+    # Each row is written as soon as it is read, nothing is cached or buffered
+    def generate():
+        for row in rows:
+            yield json.dumps(row).encode("utf-8") + b"\n"
+
+    return Response(
+        stream_with_context(generate()),
+        status=200,
+        headers={'Access-Control-Allow-Origin': '*'},
+        mimetype="application/x-ndjson"
+    )
+
+
+def bodyResponse(entry, fromCache, entryClass, ttl=ENTRY_CLASS_TTL):
+    encoding = negotiate(requestHeader("Accept-Encoding"))
+    if encoding is not None and not should_compress(entry.body):
+        encoding = None
+
+    responseHeaders = dict(
+        headers,
+        Vary="Accept, Accept-Encoding",
+        ETag=entry.etag_for(encoding)
+    )
+    responseHeaders["Cache-Control"] = cacheControl(entryClass, ttl)
+
+    # The client already has this data
+    if entry.matches(requestHeader("If-None-Match")):
+        return b"", 304, responseHeaders
+
+    # Cache hits are served from the precompressed copies
+    body = entry.encoded(encoding) if fromCache else None
+    if body is None:
+        body = entry.render(fromCache)
+        if encoding is not None:
+            body = compress(body, encoding)
+
+    if encoding is not None:
+        responseHeaders["Content-Encoding"] = encoding
+    return body, 200, responseHeaders
+
+
+def loadEntry(cacheKey, fetchData, description, timed=False):
+    # The cached body for a key, fetching it if needed - returns (entry, fromCache)
+    #   timed fetchData() returns (data, ttl) and the entry is kept for ttl, otherwise for its entry class' TTL
+    cacheKey = data_versions.key(cacheKey)
+    cached = cache.get(cacheKey)
+    if cached is not None:
+        print("Returning cache. " + description + ":")
+        return cached, True
+
+    print("Not in Cache: " + description)
+
+    def fetchAndPopulate():
+        ttl = ENTRY_CLASS_TTL
+        data = fetchData()
+        if timed:
+            data, ttl = data
+        entry = CachedBody(data).precompress()
+        if timed:
+            entry.expires = expiry(ttl)
+        # Populate Cache
+        cache.set(cacheKey, entry, size=entry.size, ttl=ttl)
+        return entry
+
+    # Concurrent misses share the one query, only the request that ran it reports fromCache: false
+    entry, executed = single_flight.do(cacheKey, fetchAndPopulate)
+    return entry, not executed
+
+
+def cachedResponse(cacheKey, fetchData, description, timed=False):
+    try:
+        entry, fromCache = loadEntry(
+            cacheKey, fetchData, description, timed)
+    except SingleFlightTimeout:
+        return DATA_TIMEOUT, 504, headers
+
+    ttl = remaining(entry.expires) if timed else ENTRY_CLASS_TTL
+    return bodyResponse(entry, fromCache=fromCache, entryClass=cacheKey[1], ttl=ttl)
+
+
+# Batch requests load each utility on its own thread, so take as long as the slowest utility
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", len(UTILITIES)))
+batchPool = ThreadPoolExecutor(
+    max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+
+
+def selectUtilities(utilities):
+    # "all" or a comma separated list, None if any of them isn't a utility
+    names = UTILITIES if utilities == "all" else dict.fromkeys(
+        utilities.split(","))
+    selected = {}
+    for name in names:
+        utilityClass = selectUtility(name)
+        if utilityClass == None:
+            return None
+        selected[name] = utilityClass
+    return selected
+
+
+def batchResponse(utilityClasses, keyParts, fetchData, description, timed=False):
+    """
+    One body holding each utility's data under its name, {"data": {"tepco": ..., "kepco": ...}}.
+    Every utility uses (and fills) the same cache entries as its single utility route.
+    A timed body is fresh for as long as the first of its utilities' entries.
+    """
+    entryClass = keyParts[0]
+
+    def load(utility):
+        return loadEntry(
+            (utility,) + keyParts,
+            lambda: fetchData(utilityClasses[utility]),
+            utility + " " + description,
+            timed
+        )
+
+    try:
+        entries = list(batchPool.map(load, utilityClasses))
+    except SingleFlightTimeout:
+        return DATA_TIMEOUT, 504, headers
+
+    data = b", ".join(
+        json.dumps(utility).encode("utf-8") + b": " + entry.data
+        for utility, (entry, fromCache) in zip(utilityClasses, entries)
+    )
+    fromCache = all(fromCache for entry, fromCache in entries)
+    ttl = ENTRY_CLASS_TTL
+    if timed:
+        ttl = shortest(remaining(entry.expires) for entry, fromCache in entries)
+    return bodyResponse(CachedBody.from_encoded(b"{" + data + b"}"), fromCache=fromCache, entryClass=entryClass, ttl=ttl)
+
+
+def binaryResponse(cacheKey, fetchFrame, mimetype, description, timed=False):
+    # Arrow/Parquet bytes are cached as they are, next to the JSON for the same data
+    if not arrow_formats.available():
+        return FORMAT_UNAVAILABLE, 406, headers
+
+    cacheKey = data_versions.key(cacheKey + (mimetype,))
+    responseHeaders = dict(
+        headers,
+        Vary="Accept"
+    )
+    responseHeaders["content-type"] = mimetype
+    responseHeaders["mimetype"] = mimetype
+
+    # Cached as (body, etag, expires) so a hit isn't hashed again
+    cached = cache.get(cacheKey)
+    if cached is not None:
+        print("Returning cache. " + description + ":")
+    else:
+        print("Not in Cache: " + description)
+
+        def fetchAndPopulate():
+            # Timed like loadEntry, fetchFrame() returns (frame, ttl)
+            ttl = ENTRY_CLASS_TTL
+            frame = fetchFrame()
+            if timed:
+                frame, ttl = frame
+            body = arrow_formats.encode(frame, mimetype)
+            cached = (body, body_etag(body), expiry(ttl) if timed else None)
+            cache.set(cacheKey, cached, size=len(body), ttl=ttl)
+            return cached
+
+        try:
+            cached, executed = single_flight.do(cacheKey, fetchAndPopulate)
+        except SingleFlightTimeout:
+            return DATA_TIMEOUT, 504, headers
+
+    body, etag, expires = cached
+    ttl = remaining(expires) if timed else ENTRY_CLASS_TTL
+    responseHeaders["Cache-Control"] = cacheControl(cacheKey[1], ttl)
+    responseHeaders["ETag"] = '"' + etag + '"'
+
+    # The client already has this data
+    if etag_matches(requestHeader("If-None-Match"), etag):
+        return b"", 304, responseHeaders
+
+    return body, 200, responseHeaders
+
+
+@app.errorhandler(UnsupportedQuery)
+def unsupportedQuery(e):
+    # e.g. forecasts on the local backend, which can't run BigQuery ML
+    print("Unsupported query: " + str(e))
+    return UNSUPPORTED_QUERY, 501, headers
 
 
 def selectUtility(utility):
-    utilities = {
-        "tepco": TepcoAPI(),
-        "tohokuden": TohokudenAPI(),
-        "kepco": KepcoAPI(),
-        "chuden": ChudenAPI(),
-        "hepco": HepcoAPI(),
-        "rikuden": RikudenAPI(),
-        "cepco": CepcoAPI(),
-        "yonden": YondenAPI(),
-        "kyuden": KyudenAPI(),
-        "okiden": OkidenAPI(),
-    }
-    return utilities.get(utility, None)
+    return utility_apis.get(utility)
 
 
 def validateDates(fromDate, toDate):
@@ -119,26 +340,12 @@ def validateDates(fromDate, toDate):
 
 
 def api(request):
-    with app.app_context():
-        headers = werkzeug.datastructures.Headers()
-        for key, value in request.headers.items():
-            headers.add(key, value)
-        with app.test_request_context(method=request.method, base_url=request.base_url, path=request.path, query_string=request.query_string, headers=headers, data=request.data):
-            try:
-                rv = app.preprocess_request()
-                if rv is None:
-                    rv = app.dispatch_request()
-            except Exception as e:
-                rv = app.handle_user_exception(e)
-            response = app.make_response(rv)
-            return app.process_response(response)
+    return dispatch(app, request)
 
 
 @app.route('/v1/carbon_intensity/historic/<utility>/<fromDate>', defaults={'toDate': None})
 @app.route('/v1/carbon_intensity/historic/<utility>/<fromDate>/<toDate>')
 def historical_intensity(utility, fromDate, toDate=None):
-    response = {}
-
     # Check Utility
     utilityClass = selectUtility(utility)
     if utilityClass == None:
@@ -151,62 +358,64 @@ def historical_intensity(utility, fromDate, toDate=None):
     if(toDate == None):
         toDate = fromDate
 
-    # Check Cache
-    try:
-        if toDate in cache[utility]["historical_intensity"][fromDate]:
-            print("Returning cache. " + utility +
-                  " historical_intensity " + fromDate + "-" + toDate + ":")
-            return json.dumps(cache[utility]["historical_intensity"][fromDate][toDate]), 200, headers
-    except KeyError:
-        print("Not in Cache: " + utility +
-              " historical_intensity " + fromDate + "-" + toDate)
-
-    response['data'] = utilityClass.historic_intensity(fromDate, toDate)
-    response['fromCache'] = True
-
-    # Populate Cache
-    if not "historical_intensity" in cache[utility]:
-        cache[utility]["historical_intensity"] = {}
-    if not fromDate in cache[utility]["historical_intensity"]:
-        cache[utility]["historical_intensity"][fromDate] = {}
-    if not toDate in cache[utility]["historical_intensity"][fromDate]:
-        cache[utility]["historical_intensity"][fromDate][toDate] = {}
+    # Long ranges can be streamed one row per line
+    if requestArg("format") == "ndjson":
+        return ndjsonResponse(utilityClass.stream_historic_intensity(fromDate, toDate))
+
+    binaryFormat = arrow_formats.negotiate(requestHeader("Accept"))
+    if binaryFormat is not None:
+        return binaryResponse(
+            (utility, "historical_intensity", fromDate, toDate),
+            lambda: (utilityClass.historic_intensity_frame(
+                fromDate, toDate)[['timestamp', 'carbon_intensity']], range_ttl(toDate)),
+            binaryFormat,
+            utility + " historical_intensity " + fromDate + "-" + toDate,
+            timed=True
+        )
 
-    cache[utility]["historical_intensity"][fromDate][toDate] = copy.deepcopy(
-        response)
-    response["fromCache"] = False
+    layout = requestLayout()
+    if layout == None:
+        return BAD_LAYOUT, 400, headers
 
-    return json.dumps(response), 200, headers
+    return cachedResponse(
+        (utility, "historical_intensity", fromDate, toDate) + layoutKey(*layout),
+        # Ranges that finished long enough ago never change
+        lambda: (utilityClass.historic_intensity(
+            fromDate, toDate, *layout), range_ttl(toDate)),
+        utility + " historical_intensity " + fromDate + "-" + toDate,
+        timed=True
+    )
 
 
 @app.route('/v1/carbon_intensity/average/<utility>')
 def daily_carbon_intensity(utility):
-    response = {}
-
     utilityClass = selectUtility(utility)
 
     if utilityClass == None:
         return BAD_UTILITY, 400, headers
 
-    # Check Cache
-    if "daily_intensity" in cache[utility]:
-        print("Returning cache. " + utility + " daily_intensity:")
-        return json.dumps(cache[utility]["daily_intensity"]), 200, headers
+    layout = requestLayout()
+    if layout == None:
+        return BAD_LAYOUT, 400, headers
 
-    response['data'] = utilityClass.daily_intensity()
-    response['fromCache'] = True
+    return cachedResponse(
+        (utility, "daily_intensity") + layoutKey(*layout),
+        lambda: utilityClass.daily_intensity(layout[0]),
+        utility + " daily_intensity"
+    )
 
-    # Populate Cache
-    cache[utility]["daily_intensity"] = copy.deepcopy(response)
-    response["fromCache"] = False
 
-    return json.dumps(response), 200, headers
+# Breakdown -> UtilityAPI method
+BREAKDOWNS = {
+    "year": "daily_intensity_by_year",
+    "month": "daily_intensity_by_month",
+    "month_and_year": "daily_intensity_by_month_and_year",
+    "month_and_weekday": "daily_intensity_by_month_and_weekday"
+}
 
 
 @app.route('/v1/carbon_intensity/average/<breakdown>/<utility>')
 def daily_carbon_intensity_with_breakdown(utility, breakdown):
-    response = {}
-
     utilityClass = selectUtility(utility)
 
     # Sense Check Utiltity
@@ -214,36 +423,23 @@ def daily_carbon_intensity_with_breakdown(utility, breakdown):
         return BAD_UTILITY, 400, headers
 
     # Check Breakdown Type
-    breakdowns = {
-        "year": utilityClass.daily_intensity_by_year,
-        "month": utilityClass.daily_intensity_by_month,
-        "month_and_year": utilityClass.daily_intensity_by_month_and_year,
-        "month_and_weekday": utilityClass.daily_intensity_by_month_and_weekday
-    }
-    dataSource = breakdowns.get(breakdown, None)
-    if dataSource == None:
+    if breakdown not in BREAKDOWNS:
         return BAD_BREAKDOWN, 400, headers
+    dataSource = getattr(utilityClass, BREAKDOWNS[breakdown])
 
-    # Check Cache
-    if breakdown in cache[utility]:
-        print("Returning cache. " + utility +
-              " daily_intensity_by_" + breakdown + ":")
-        return json.dumps(cache[utility][breakdown]), 200, headers
-
-    response['data'] = dataSource()
-    response['fromCache'] = True
-
-    # Populate Cache
-    cache[utility][breakdown] = copy.deepcopy(response)
-    response["fromCache"] = False
+    layout = requestLayout()
+    if layout == None:
+        return BAD_LAYOUT, 400, headers
 
-    return json.dumps(response), 200, headers
+    return cachedResponse(
+        (utility, "daily_intensity_by", breakdown) + layoutKey(*layout),
+        lambda: dataSource(layout[0]),
+        utility + " daily_intensity_by_" + breakdown
+    )
 
 
 @app.route('/v1/carbon_intensity/forecast/average/<year>/<utility>')
 def daily_carbon_intensity_prediction(utility, year):
-    response = {}
-
     utilityClass = selectUtility(utility)
 
     # Sense Check Utiltity
@@ -257,27 +453,17 @@ def daily_carbon_intensity_prediction(utility, year):
     print("Fetching Prediction - " + utility +
           " predicted intensity for " + str(year) + ":")
 
-    # Check Cache
-    if year in cache[utility]:
-        print("Returning cache...")
-        return json.dumps(cache[utility][year]), 200, headers
-
-    response['data'] = utilityClass.daily_intensity_prediction_for_year_by_month_and_weekday(
-        year)
-    response['fromCache'] = True
-
-    # Populate Cache
-    cache[utility][year] = copy.deepcopy(response)
-    response["fromCache"] = False
-
-    return json.dumps(response), 200, headers
+    return cachedResponse(
+        (utility, "prediction_year", str(year)),
+        lambda: utilityClass.daily_intensity_prediction_for_year_by_month_and_weekday(
+            year),
+        utility + " prediction_year " + str(year)
+    )
 
 
 @app.route('/v1/carbon_intensity/forecast/<utility>/<fromDate>', defaults={'toDate': None})
 @app.route('/v1/carbon_intensity/forecast/<utility>/<fromDate>/<toDate>')
 def carbon_intensity_timeseries_prediction(utility, fromDate, toDate=None):
-    response = {}
-
     # Check Utility
     utilityClass = selectUtility(utility)
     if utilityClass == None:
@@ -292,29 +478,124 @@ def carbon_intensity_timeseries_prediction(utility, fromDate, toDate=None):
 
     print("Fetching Prediction - " + utility + ":")
 
-    # Check Cache
-    try:
-        if toDate in cache[utility]["prediction"][fromDate]:
-            print("Returning cache. " + utility +
-                  " prediction " + fromDate + "-" + toDate + ":")
-            return json.dumps(cache[utility]["prediction"][fromDate][toDate]), 200, headers
-    except KeyError:
-        print("Not in Cache: " + utility +
-              " prediction " + fromDate + "-" + toDate)
-
-    response['data'] = utilityClass.timeseries_prediction(fromDate, toDate)
-    response['fromCache'] = True
-
-    # Populate Cache
-    if not "prediction" in cache[utility]:
-        cache[utility]["prediction"] = {}
-    if not fromDate in cache[utility]["prediction"]:
-        cache[utility]["prediction"][fromDate] = {}
-    if not toDate in cache[utility]["prediction"][fromDate]:
-        cache[utility]["prediction"][fromDate][toDate] = {}
-
-    cache[utility]["prediction"][fromDate][toDate] = copy.deepcopy(
-        response)
-    response["fromCache"] = False
-
-    return json.dumps(response), 200, headers
+    binaryFormat = arrow_formats.negotiate(requestHeader("Accept"))
+    if binaryFormat is not None:
+        return binaryResponse(
+            (utility, "prediction", fromDate, toDate),
+            lambda: (utilityClass.timeseries_prediction_frame(fromDate, toDate),
+                     utilityClass.prediction_ttl(fromDate, toDate)),
+            binaryFormat,
+            utility + " prediction " + fromDate + "-" + toDate,
+            timed=True
+        )
+
+    layout = requestLayout()
+    if layout == None:
+        return BAD_LAYOUT, 400, headers
+
+    return cachedResponse(
+        (utility, "prediction", fromDate, toDate) + layoutKey(*layout),
+        # Until the next forecast is made
+        lambda: (utilityClass.timeseries_prediction(fromDate, toDate, *layout),
+                 utilityClass.prediction_ttl(fromDate, toDate)),
+        utility + " prediction " + fromDate + "-" + toDate,
+        timed=True
+    )
+
+
+# Batch Routes - <utilities> is a comma separated list of utilities, or "all"
+
+@app.route('/v1/batch/carbon_intensity/historic/<utilities>/<fromDate>', defaults={'toDate': None})
+@app.route('/v1/batch/carbon_intensity/historic/<utilities>/<fromDate>/<toDate>')
+def batch_historical_intensity(utilities, fromDate, toDate=None):
+    utilityClasses = selectUtilities(utilities)
+    if utilityClasses == None:
+        return BAD_UTILITY, 400, headers
+
+    datesValid = validateDates(fromDate, toDate)
+    if(datesValid["valid"] == False):
+        return datesValid["response"], 400, headers
+
+    if(toDate == None):
+        toDate = fromDate
+
+    layout = requestLayout()
+    if layout == None:
+        return BAD_LAYOUT, 400, headers
+
+    return batchResponse(
+        utilityClasses,
+        ("historical_intensity", fromDate, toDate) + layoutKey(*layout),
+        lambda utilityClass: (utilityClass.historic_intensity(
+            fromDate, toDate, *layout), range_ttl(toDate)),
+        "historical_intensity " + fromDate + "-" + toDate,
+        timed=True
+    )
+
+
+@app.route('/v1/batch/carbon_intensity/average/<utilities>')
+def batch_daily_carbon_intensity(utilities):
+    utilityClasses = selectUtilities(utilities)
+    if utilityClasses == None:
+        return BAD_UTILITY, 400, headers
+
+    layout = requestLayout()
+    if layout == None:
+        return BAD_LAYOUT, 400, headers
+
+    return batchResponse(
+        utilityClasses,
+        ("daily_intensity",) + layoutKey(*layout),
+        lambda utilityClass: utilityClass.daily_intensity(layout[0]),
+        "daily_intensity"
+    )
+
+
+@app.route('/v1/batch/carbon_intensity/average/<breakdown>/<utilities>')
+def batch_daily_carbon_intensity_with_breakdown(utilities, breakdown):
+    utilityClasses = selectUtilities(utilities)
+    if utilityClasses == None:
+        return BAD_UTILITY, 400, headers
+
+    if breakdown not in BREAKDOWNS:
+        return BAD_BREAKDOWN, 400, headers
+
+    layout = requestLayout()
+    if layout == None:
+        return BAD_LAYOUT, 400, headers
+
+    return batchResponse(
+        utilityClasses,
+        ("daily_intensity_by", breakdown) + layoutKey(*layout),
+        lambda utilityClass: getattr(
+            utilityClass, BREAKDOWNS[breakdown])(layout[0]),
+        "daily_intensity_by_" + breakdown
+    )
+
+
+@app.route('/v1/batch/carbon_intensity/forecast/<utilities>/<fromDate>', defaults={'toDate': None})
+@app.route('/v1/batch/carbon_intensity/forecast/<utilities>/<fromDate>/<toDate>')
+def batch_carbon_intensity_timeseries_prediction(utilities, fromDate, toDate=None):
+    utilityClasses = selectUtilities(utilities)
+    if utilityClasses == None:
+        return BAD_UTILITY, 400, headers
+
+    datesValid = validateDates(fromDate, toDate)
+    if(datesValid["valid"] == False):
+        return datesValid["response"], 400, headers
+
+    if(toDate == None):
+        toDate = fromDate
+
+    layout = requestLayout()
+    if layout == None:
+        return BAD_LAYOUT, 400, headers
+
+    return batchResponse(
+        utilityClasses,
+        ("prediction", fromDate, toDate) + layoutKey(*layout),
+        lambda utilityClass: (utilityClass.timeseries_prediction(fromDate, toDate, *layout),
+                              utilityClass.prediction_ttl(fromDate, toDate)),
+        "prediction " + fromDate + "-" + toDate,
+        timed=True
+    )
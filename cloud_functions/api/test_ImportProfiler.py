@@ -0,0 +1,30 @@
+import sys
+from .ImportProfiler import ImportProfiler
+
+
+def test_records_new_imports(tmp_path, capsys):
+    (tmp_path / "profiled_parent.py").write_text("import profiled_child\n")
+    (tmp_path / "profiled_child.py").write_text("x = sum(range(1000))\n")
+    sys.path.insert(0, str(tmp_path))
+
+    profiler = ImportProfiler(budget_ms=0).install()
+    try:
+        import profiled_parent
+    finally:
+        profiler.uninstall()
+        sys.path.remove(str(tmp_path))
+        sys.modules.pop("profiled_parent", None)
+        sys.modules.pop("profiled_child", None)
+
+    timings = {t["module"]: t for t in profiler.timings}
+    assert timings["profiled_parent"]["top_level"]
+    assert not timings["profiled_child"]["top_level"]
+    assert timings["profiled_parent"]["cumulative_ms"] >= timings["profiled_child"]["cumulative_ms"]
+
+    total = profiler.report("test")
+    output = capsys.readouterr().out
+    assert total == timings["profiled_parent"]["cumulative_ms"]
+    assert "profiled_child" in output
+    assert "over the 0ms cold start budget" in output
+
+    assert profiler not in sys.meta_path
@@ -0,0 +1,40 @@
+import pytest
+import pandas as pd
+from .arrow_formats import negotiate, encode, available, ARROW_STREAM, PARQUET
+
+needs_pyarrow = pytest.mark.skipif(
+    not available(), reason="pyarrow not installed")
+
+df = pd.DataFrame({
+    "timestamp": pd.to_datetime(["2020-11-01 00:00:00", "2020-11-01 01:00:00"], utc=True),
+    "carbon_intensity": [500.5, 550.0]
+})
+
+
+def test_negotiate():
+    assert negotiate(None) is None
+    assert negotiate("application/json") is None
+    assert negotiate("*/*") is None
+    assert negotiate(ARROW_STREAM) == ARROW_STREAM
+    assert negotiate("application/x-parquet, */*;q=0.1") == PARQUET
+    assert negotiate(ARROW_STREAM + ";q=0.5, " + PARQUET) == PARQUET
+    assert negotiate(ARROW_STREAM + ";q=0") is None
+
+
+@needs_pyarrow
+def test_arrow_stream_round_trip():
+    import pyarrow as pa
+    body = encode(df, ARROW_STREAM)
+
+    table = pa.ipc.open_stream(body).read_all()
+    pd.testing.assert_frame_equal(table.to_pandas(), df)
+
+
+@needs_pyarrow
+def test_parquet_round_trip():
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    body = encode(df, PARQUET)
+
+    table = pq.read_table(pa.BufferReader(body))
+    pd.testing.assert_frame_equal(table.to_pandas(), df)
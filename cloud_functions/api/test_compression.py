@@ -0,0 +1,31 @@
+import pytest
+import gzip
+from .compression import negotiate, compress, compress_variants, SUPPORTED_ENCODINGS, brotli
+
+
+def test_negotiate():
+    assert negotiate(None) is None
+    assert negotiate("") is None
+    assert negotiate("identity") is None
+    assert negotiate("gzip") == "gzip"
+    assert negotiate("deflate, gzip;q=0.5") == "gzip"
+    assert negotiate("gzip;q=0") is None
+    assert negotiate("*") == SUPPORTED_ENCODINGS[0]
+
+
+@pytest.mark.skipif(brotli is None, reason="brotli not installed")
+def test_negotiate_prefers_brotli():
+    assert negotiate("gzip, deflate, br") == "br"
+    assert negotiate("gzip, br;q=0.5") == "gzip"
+
+
+def test_gzip_round_trip_and_repeatable():
+    body = b'{"data": [1, 2, 3]}' * 100
+
+    assert gzip.decompress(compress(body, "gzip")) == body
+    assert compress(body, "gzip") == compress(body, "gzip")
+
+
+def test_small_bodies_not_compressed():
+    assert compress_variants(b'{"data": "xyz"}') == {}
+    assert set(compress_variants(b"x" * 5000)) == set(SUPPORTED_ENCODINGS)
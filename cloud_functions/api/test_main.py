@@ -2,13 +2,24 @@ import pytest
 import json
 import gc
 import os
+import threading
+import time
+import gzip
+import pandas as pd
 os.environ["STAGE"] = "staging"
 
-from .main import (daily_carbon_intensity,
+from flask import Flask, request
+from . import arrow_formats
+from .cache.DataVersions import DataVersions, FileVersionStore
+from .utilities.QueryBackend import UnsupportedQuery
+from .utilities.UtilityRegistry import UTILITIES
+from .main import (api,
+                   daily_carbon_intensity,
                    daily_carbon_intensity_with_breakdown,
                    daily_carbon_intensity_prediction,
                    carbon_intensity_timeseries_prediction,
                    clearCache,
+                   batch_daily_carbon_intensity,
                    generate_standard_error_model,
                    historical_intensity)
 
@@ -20,6 +31,93 @@ def before_each():
     gc.collect()
 
 
+# Function Entry Point
+
+# Stands in for the functions framework, which hands api() its own flask request
+framework = Flask("framework")
+
+
+def call_api(path, **kwargs):
+    with framework.test_request_context(path, **kwargs):
+        return api(request)
+
+
+def test_api_dispatches_to_route():
+    response = call_api("/v1/carbon_intensity/average/fish")
+
+    assert response.status_code == 400
+    assert response.get_data(as_text=True) == generate_standard_error_model(
+        'Invalid Utility Specified', 400)
+    assert response.headers['Access-Control-Allow-Origin'] == '*'
+
+
+def test_api_unknown_route():
+    response = call_api("/v1/fish")
+
+    assert response.status_code == 404
+
+
+def test_api_route_response(mocker):
+    mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.daily_intensity',
+        return_value='xyz'
+    )
+
+    response = call_api("/v1/carbon_intensity/average/tepco",
+                        headers={"Accept": "application/json"})
+
+    assert response.status_code == 200
+    assert response.get_data() == json.dumps(
+        {"data": "xyz", "fromCache": False}).encode()
+
+
+def test_api_gzip_response(mocker):
+    data = [{"hour": h, "carbon_intensity": 500.5} for h in range(24)] * 10
+    mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.daily_intensity',
+        return_value=data
+    )
+
+    first = call_api("/v1/carbon_intensity/average/tepco",
+                     headers={"Accept-Encoding": "gzip"})
+    second = call_api("/v1/carbon_intensity/average/tepco",
+                      headers={"Accept-Encoding": "gzip"})
+    plain = call_api("/v1/carbon_intensity/average/tepco")
+
+    for response in (first, second):
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Vary"] == "Accept, Accept-Encoding"
+    assert gzip.decompress(first.get_data()) == json.dumps(
+        {"data": data, "fromCache": False}).encode()
+    assert gzip.decompress(second.get_data()) == json.dumps(
+        {"data": data, "fromCache": True}).encode()
+    assert "Content-Encoding" not in plain.headers
+    assert plain.get_data() == json.dumps(
+        {"data": data, "fromCache": True}).encode()
+
+
+def test_api_etag_and_not_modified(mocker):
+    mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.daily_intensity',
+        return_value='xyz'
+    )
+
+    first = call_api("/v1/carbon_intensity/average/tepco")
+    etag = first.headers["ETag"]
+    second = call_api("/v1/carbon_intensity/average/tepco",
+                      headers={"If-None-Match": etag})
+    other = call_api("/v1/carbon_intensity/average/tepco",
+                     headers={"If-None-Match": '"somethingelse"'})
+
+    assert first.status_code == 200
+    assert "max-age=" in first.headers["Cache-Control"]
+    assert "stale-while-revalidate=" in first.headers["Cache-Control"]
+    assert second.status_code == 304
+    assert second.get_data() == b""
+    assert second.headers["ETag"] == etag
+    assert other.status_code == 200
+
+
 # Daily Carbon Intensity
 
 def test_daily_carbon_intensity_bad_utility():
@@ -44,10 +142,27 @@ def test_daily_carbon_intensity_response(mocker):
         "fromCache": False
     }
 
-    assert body == json.dumps(expectedData)
+    assert body == json.dumps(expectedData).encode()
     assert code == 200
 
 
+def test_new_data_version_misses_the_cache(mocker, tmp_path):
+    versions = DataVersions(FileVersionStore(str(tmp_path)), check_seconds=0)
+    mocker.patch('cloud_functions.api.main.data_versions', versions)
+    query = mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.daily_intensity',
+        return_value='xyz'
+    )
+
+    daily_carbon_intensity("tepco")
+    daily_carbon_intensity("tepco")
+    versions.publish("tepco")
+    body, code, cors = daily_carbon_intensity("tepco")
+
+    assert query.call_count == 2
+    assert json.loads(body)["fromCache"] is False
+
+
 def test_daily_carbon_intensity_cache(mocker):
 
     mocker.patch(
@@ -68,8 +183,67 @@ def test_daily_carbon_intensity_cache(mocker):
         "fromCache": True
     }
 
-    assert body1 == json.dumps(expectedData1)
-    assert body2 == json.dumps(expectedData2)
+    assert body1 == json.dumps(expectedData1).encode()
+    assert body2 == json.dumps(expectedData2).encode()
+
+
+def test_daily_carbon_intensity_concurrent_misses_share_one_query(mocker):
+    release = threading.Event()
+
+    def slow_daily_intensity(self, layout="records"):
+        release.wait(5)
+        return 'xyz'
+
+    query = mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.daily_intensity',
+        side_effect=slow_daily_intensity,
+        autospec=True
+    )
+
+    bodies = []
+    threads = [threading.Thread(target=lambda: bodies.append(
+        daily_carbon_intensity("tepco")[0])) for i in range(3)]
+    for t in threads:
+        t.start()
+    # Let the other requests join the in-flight query before it returns
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert query.call_count == 1
+    assert sorted(bodies) == sorted([
+        json.dumps({"data": "xyz", "fromCache": False}).encode(),
+        json.dumps({"data": "xyz", "fromCache": True}).encode(),
+        json.dumps({"data": "xyz", "fromCache": True}).encode(),
+    ])
+
+
+def test_daily_carbon_intensity_columnar_is_cached_separately(mocker):
+    query = mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.daily_intensity',
+        side_effect=lambda layout: layout
+    )
+
+    records = call_api("/v1/carbon_intensity/average/tepco")
+    columnar = call_api("/v1/carbon_intensity/average/tepco?layout=columnar")
+    cached = call_api("/v1/carbon_intensity/average/tepco?layout=columnar")
+
+    assert json.loads(records.get_data())["data"] == "records"
+    assert json.loads(columnar.get_data()) == {
+        "data": "columnar", "fromCache": False}
+    assert json.loads(cached.get_data()) == {
+        "data": "columnar", "fromCache": True}
+    assert query.call_count == 2
+
+
+def test_daily_carbon_intensity_bad_layout():
+    bad_layout = call_api("/v1/carbon_intensity/average/tepco?layout=rows")
+    bad_timestamps = call_api(
+        "/v1/carbon_intensity/historic/tepco/2020-01-02?layout=columnar&timestamps=unix")
+
+    assert bad_layout.status_code == 400
+    assert bad_timestamps.status_code == 400
 
 
 # Daily Carbon Intensity by Breakdown
@@ -106,7 +280,7 @@ def test_daily_carbon_intensity_with_breakdown_response(mocker):
         "fromCache": False
     }
 
-    assert body == json.dumps(expectedData)
+    assert body == json.dumps(expectedData).encode()
     assert code == 200
 
 
@@ -132,8 +306,8 @@ def test_daily_carbon_intensity_with_breakdown_cache(mocker):
         "fromCache": True
     }
 
-    assert body1 == json.dumps(expectedData1)
-    assert body2 == json.dumps(expectedData2)
+    assert body1 == json.dumps(expectedData1).encode()
+    assert body2 == json.dumps(expectedData2).encode()
 
 
 # Daily Carbon Intensity Predictions
@@ -170,7 +344,7 @@ def test_daily_carbon_intensity_predictions_response(mocker):
         "fromCache": False
     }
 
-    assert body == json.dumps(expectedData)
+    assert body == json.dumps(expectedData).encode()
     assert code == 200
 
 
@@ -196,8 +370,8 @@ def test_daily_carbon_intensity_predictions_cache(mocker):
         "fromCache": True
     }
 
-    assert body1 == json.dumps(expectedData1)
-    assert body2 == json.dumps(expectedData2)
+    assert body1 == json.dumps(expectedData1).encode()
+    assert body2 == json.dumps(expectedData2).encode()
 
 # Carbon Intensity Timeseries Predictions
 
@@ -240,6 +414,10 @@ def test_carbon_intensity_timeseries_prediction_response(mocker):
         'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.timeseries_prediction',
         return_value='xyz'
     )
+    mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.prediction_ttl',
+        return_value=600
+    )
 
     body, code, cors = carbon_intensity_timeseries_prediction(
         "tepco", "2020-01-01")
@@ -249,7 +427,7 @@ def test_carbon_intensity_timeseries_prediction_response(mocker):
         "fromCache": False
     }
 
-    assert body == json.dumps(expectedData)
+    assert body == json.dumps(expectedData).encode()
     assert code == 200
 
 
@@ -259,6 +437,10 @@ def test_carbon_intensity_timeseries_prediction_cache(mocker):
         'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.timeseries_prediction',
         return_value='xyz'
     )
+    mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.prediction_ttl',
+        return_value=600
+    )
 
     body1, code1, cors1 = carbon_intensity_timeseries_prediction(
         "tepco", "2020-01-01")
@@ -275,8 +457,27 @@ def test_carbon_intensity_timeseries_prediction_cache(mocker):
         "fromCache": True
     }
 
-    assert body1 == json.dumps(expectedData1)
-    assert body2 == json.dumps(expectedData2)
+    assert body1 == json.dumps(expectedData1).encode()
+    assert body2 == json.dumps(expectedData2).encode()
+
+
+def test_carbon_intensity_timeseries_prediction_cache_control(mocker):
+
+    mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.timeseries_prediction',
+        return_value='xyz'
+    )
+    mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.prediction_ttl',
+        return_value=600
+    )
+
+    body, code, headers = carbon_intensity_timeseries_prediction(
+        "tepco", "2020-01-01")
+
+    # Fresh until the forecast that was served is replaced
+    maxAge = int(headers["Cache-Control"].split("max-age=")[1].split(",")[0])
+    assert 599 <= maxAge <= 600
 
 
 # Carbon Intensity Historic Intensities
@@ -321,7 +522,7 @@ def test_carbon_intensity_historical_response(mocker):
         "fromCache": False
     }
 
-    assert body == json.dumps(expectedData)
+    assert body == json.dumps(expectedData).encode()
     assert code == 200
 
 
@@ -347,5 +548,180 @@ def test_carbon_intensity_historical_cache(mocker):
         "fromCache": True
     }
 
-    assert body1 == json.dumps(expectedData1)
-    assert body2 == json.dumps(expectedData2)
+    assert body1 == json.dumps(expectedData1).encode()
+    assert body2 == json.dumps(expectedData2).encode()
+
+
+def test_carbon_intensity_historical_cache_control_by_age(mocker):
+
+    mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.historic_intensity',
+        return_value='xyz'
+    )
+    today = pd.Timestamp.utcnow().strftime('%Y-%m-%d')
+
+    body1, code1, headers1 = historical_intensity(
+        "tepco", "2020-01-02", "2020-02-02")
+    body2, code2, headers2 = historical_intensity(
+        "tepco", "2020-01-02", today)
+
+    assert headers1["Cache-Control"] == "public, max-age=31536000, immutable"
+    maxAge = int(headers2["Cache-Control"].split("max-age=")[1].split(",")[0])
+    assert 899 <= maxAge <= 900
+    assert "immutable" not in headers2["Cache-Control"]
+
+
+def test_carbon_intensity_historical_ndjson(mocker):
+    rows = [
+        {"timestamp": "2020-01-02 00:00:00+00:00", "carbon_intensity": 500},
+        {"timestamp": "2020-01-02 01:00:00+00:00", "carbon_intensity": 550}
+    ]
+    mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.stream_historic_intensity',
+        return_value=iter(rows)
+    )
+
+    response = call_api(
+        "/v1/carbon_intensity/historic/tepco/2020-01-02?format=ndjson")
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.is_streamed
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == rows
+
+
+@pytest.mark.skipif(not arrow_formats.available(), reason="pyarrow not installed")
+def test_carbon_intensity_historical_arrow(mocker):
+    import pyarrow as pa
+    frame = pd.DataFrame({
+        "timestamp": pd.to_datetime(["2020-01-02 00:00:00"], utc=True),
+        "carbon_intensity": [500.5]
+    })
+    query = mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.historic_intensity_frame',
+        return_value=frame
+    )
+
+    accept = {"Accept": arrow_formats.ARROW_STREAM}
+    first = call_api("/v1/carbon_intensity/historic/tepco/2020-01-02",
+                     headers=accept)
+    second = call_api("/v1/carbon_intensity/historic/tepco/2020-01-02",
+                      headers=accept)
+
+    assert first.status_code == 200
+    assert first.mimetype == arrow_formats.ARROW_STREAM
+    assert pa.ipc.open_stream(first.get_data()).read_all().to_pandas().equals(frame)
+    assert second.get_data() == first.get_data()
+    assert query.call_count == 1
+
+
+@pytest.mark.skipif(not arrow_formats.available(), reason="pyarrow not installed")
+def test_carbon_intensity_historical_arrow_etag(mocker):
+    mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.historic_intensity_frame',
+        return_value=pd.DataFrame({
+            "timestamp": pd.to_datetime(["2020-01-02 00:00:00"], utc=True),
+            "carbon_intensity": [500.5]
+        })
+    )
+
+    first = call_api("/v1/carbon_intensity/historic/tepco/2020-01-02",
+                     headers={"Accept": arrow_formats.PARQUET})
+    second = call_api("/v1/carbon_intensity/historic/tepco/2020-01-02",
+                      headers={"Accept": arrow_formats.PARQUET,
+                               "If-None-Match": first.headers["ETag"]})
+
+    assert first.status_code == 200
+    assert second.status_code == 304
+    assert second.get_data() == b""
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_carbon_intensity_historical_arrow_unavailable(mocker):
+    mocker.patch('cloud_functions.api.arrow_formats.available',
+                 return_value=False)
+
+    response = call_api("/v1/carbon_intensity/historic/tepco/2020-01-02",
+                        headers={"Accept": arrow_formats.PARQUET})
+
+    assert response.status_code == 406
+
+
+def test_unsupported_query_is_not_implemented(mocker):
+    mocker.patch(
+        'cloud_functions.api.utilities.tepco.TepcoAPI.TepcoAPI.daily_intensity_prediction_for_year_by_month_and_weekday',
+        side_effect=UnsupportedQuery("Models and statements only run on BigQuery")
+    )
+
+    response = call_api("/v1/carbon_intensity/forecast/average/{}/tepco".format(
+        pd.Timestamp.utcnow().year))
+
+    assert response.status_code == 501
+    assert response.get_json()["code"] == 501
+
+
+# Batch Routes
+
+def test_batch_daily_carbon_intensity(mocker):
+    clearCache('kepco')
+    release = threading.Event()
+    started = []
+
+    def daily_intensity(self, layout="records"):
+        # Both utilities have to be running at once for either to finish
+        started.append(self.utility)
+        if len(started) == 2:
+            release.set()
+        release.wait(5)
+        return self.utility + " data"
+
+    query = mocker.patch(
+        'cloud_functions.api.utilities.UtilityAPI.UtilityAPI.daily_intensity',
+        side_effect=daily_intensity,
+        autospec=True
+    )
+
+    body1, code1, headers1 = batch_daily_carbon_intensity("tepco,kepco")
+    body2, code2, headers2 = batch_daily_carbon_intensity("tepco,kepco")
+    single, code3, headers3 = daily_carbon_intensity("kepco")
+
+    assert release.is_set()
+    assert code1 == 200
+    assert body1 == json.dumps({
+        "data": {"tepco": "tepco data", "kepco": "kepco data"},
+        "fromCache": False
+    }).encode()
+    assert body2 == json.dumps({
+        "data": {"tepco": "tepco data", "kepco": "kepco data"},
+        "fromCache": True
+    }).encode()
+    # The batch shares its cache entries with the single utility routes
+    assert single == json.dumps(
+        {"data": "kepco data", "fromCache": True}).encode()
+    assert query.call_count == 2
+
+
+def test_batch_bad_utility():
+    response = call_api("/v1/batch/carbon_intensity/average/tepco,fish")
+
+    assert response.status_code == 400
+    assert response.get_data(as_text=True) == generate_standard_error_model(
+        'Invalid Utility Specified', 400)
+
+
+def test_batch_all_utilities(mocker):
+    for utility in UTILITIES:
+        clearCache(utility)
+    mocker.patch(
+        'cloud_functions.api.utilities.UtilityAPI.UtilityAPI.historic_intensity',
+        return_value='xyz'
+    )
+
+    response = call_api(
+        "/v1/batch/carbon_intensity/historic/all/2020-01-02/2020-01-03")
+
+    assert response.status_code == 200
+    data = json.loads(response.get_data())["data"]
+    assert list(data) == list(UTILITIES)
+    assert set(data.values()) == {'xyz'}
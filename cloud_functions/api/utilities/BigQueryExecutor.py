@@ -0,0 +1,193 @@
+import os
+import time
+from datetime import date, datetime
+from .QueryBackend import QueryBackend
+
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+# Python type -> BigQuery parameter type, bool before int and datetime before date as they're subclasses
+PARAMETER_TYPES = (
+    (bool, "BOOL"),
+    (int, "INT64"),
+    (float, "FLOAT64"),
+    (datetime, "TIMESTAMP"),
+    (date, "DATE"),
+    (str, "STRING"),
+)
+
+
+def parameter_type(value):
+    for python_type, bigquery_type in PARAMETER_TYPES:
+        if isinstance(value, python_type):
+            return bigquery_type
+    raise ValueError("No BigQuery parameter type for " + repr(value))
+
+
+def timeout_errors():
+    """
+    What job.result raises when a query runs over its timeout. Before Python 3.8 (the python37 runtime)
+    concurrent.futures.TimeoutError isn't the builtin, and the HTTP request itself can time out too.
+    """
+    import concurrent.futures
+    import requests
+
+    return (TimeoutError, concurrent.futures.TimeoutError, requests.exceptions.Timeout)
+
+
+def query_parameters(params):
+    # {"name": value} -> named query parameters, lists become ARRAY parameters
+    from google.cloud import bigquery
+
+    parameters = []
+    for name, value in params.items():
+        if isinstance(value, (list, tuple)):
+            parameters.append(bigquery.ArrayQueryParameter(
+                name, parameter_type(value[0]), list(value)))
+        else:
+            parameters.append(bigquery.ScalarQueryParameter(
+                name, parameter_type(value), value))
+    return parameters
+
+
+class BigQueryExecutor(QueryBackend):
+    """
+    Runs every BigQuery query for the process through one client.
+
+    The client, its credentials and a pooled HTTP session are created on the first query
+    and reused after that, rather than per call as pd.read_gbq does. Queries that run for
+    longer than `timeout` seconds are cancelled. Latency is recorded for each query label.
+
+    Values passed in `params` are sent as query parameters (@name in the SQL), so the SQL text
+    stays the same between requests and BigQuery's result cache can be used.
+
+    Results of at least `storage_min_rows` rows are downloaded with the BigQuery Storage
+    Read API (Arrow record batches) instead of paging through tabledata.list.
+    """
+    name = "BigQuery"
+
+    def __init__(self, timeout=None, pool_size=10, storage_min_rows=None,
+                 client_factory=None, storage_client_factory=None, clock=time.perf_counter):
+        super().__init__(clock=clock)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.storage_min_rows = storage_min_rows
+        self._client_factory = client_factory or self._create_client
+        self._storage_client_factory = storage_client_factory or self._create_storage_client
+        self._client = None
+        self._credentials = None
+        # False once we know the Storage API can't be used
+        self._storage_client = None
+
+    def _create_client(self):
+        # Only imported when the first query is made, it's slow to load on a cold start
+        import google.auth
+        import requests.adapters
+        from google.auth.transport.requests import AuthorizedSession
+        from google.cloud import bigquery
+
+        credentials, project = google.auth.default(scopes=SCOPES)
+        self._credentials = credentials
+        session = AuthorizedSession(credentials)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+
+        return bigquery.Client(project=project, credentials=credentials, _http=session)
+
+    def _create_storage_client(self):
+        try:
+            from google.cloud import bigquery_storage
+            read_client = bigquery_storage.BigQueryReadClient
+        except ImportError:
+            try:
+                from google.cloud import bigquery_storage_v1
+                read_client = bigquery_storage_v1.BigQueryReadClient
+            except ImportError:
+                return None
+        return read_client(credentials=self._credentials)
+
+    @property
+    def storage_client(self):
+        # None if the storage library isn't installed
+        if self._storage_client is None:
+            # Uses the same credentials as the query client
+            self.client
+            with self._lock:
+                if self._storage_client is None:
+                    self._storage_client = self._storage_client_factory() or False
+        return self._storage_client or None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def query(self, query, label="query", page_size=None, params=None, job_config=None):
+        # Waits for the query to finish and returns its RowIterator
+        if params:
+            from google.cloud import bigquery
+            job_config = job_config or bigquery.QueryJobConfig()
+            job_config.query_parameters = query_parameters(params)
+
+        start = self._clock()
+        job = self.client.query(query, job_config=job_config)
+        try:
+            rows = job.result(timeout=self.timeout, page_size=page_size)
+        except timeout_errors():
+            job.cancel()
+            raise
+        finally:
+            self._record(label, self._clock() - start)
+        return rows
+
+    def _use_storage_api(self, rows):
+        if self.storage_min_rows is None or rows.total_rows is None:
+            return False
+        return rows.total_rows >= self.storage_min_rows and self.storage_client is not None
+
+    def read_dataframe(self, query, label="query", params=None):
+        rows = self.query(query, label=label, params=params)
+
+        # Small results are quicker over REST than setting up a read session
+        start = self._clock()
+        if self._use_storage_api(rows):
+            df = rows.to_dataframe(bqstorage_client=self.storage_client)
+            self._record(label + " storage download", self._clock() - start)
+        else:
+            df = rows.to_dataframe(create_bqstorage_client=False)
+            self._record(label + " download", self._clock() - start)
+        return df
+
+    def load_dataframe(self, df, table_id, job_config=None, label="load"):
+        # Waits for a load job writing df into table_id
+        start = self._clock()
+        try:
+            job = self.client.load_table_from_dataframe(
+                df, table_id, job_config=job_config)
+            job.result(timeout=self.timeout)
+        finally:
+            self._record(label, self._clock() - start)
+
+    def execute(self, query, label="query"):
+        # DDL and model training take as long as they need, only reads are held to the timeout
+        start = self._clock()
+        try:
+            self.client.query(query).result()
+        finally:
+            self._record(label, self._clock() - start)
+
+    def table_labels(self, table_id):
+        return self.client.get_table(table_id).labels or {}
+
+    def table_version(self, table_id):
+        return self.client.get_table(table_id).modified
+
+
+executor = BigQueryExecutor(
+    timeout=float(os.environ.get("BIGQUERY_TIMEOUT", 60)),
+    pool_size=int(os.environ.get("BIGQUERY_POOL_SIZE", 10)),
+    storage_min_rows=int(os.environ.get("BIGQUERY_STORAGE_MIN_ROWS", 10000))
+)
@@ -0,0 +1,146 @@
+import os
+import json
+import uuid
+import fcntl
+import numpy as np
+import pandas as pd
+
+META_FILE = "meta.json"
+LOCK_FILE = "write.lock"
+# Times open() tries again when the files it was pointed at are replaced before it maps them
+OPEN_ATTEMPTS = 3
+
+
+def epoch_hours(timestamps):
+    """
+    Hours since 1970-01-01 00:00 UTC.
+    Naive datetimes are taken as UTC, the same as BigQuery's TIMESTAMP load and the SQL backends,
+    localized ones (e.g. Asia/Tokyo) are converted.
+    """
+    utc = pd.to_datetime(pd.Series(timestamps), utc=True)
+    return utc.values.astype("datetime64[h]").astype("int64")
+
+
+def hour_timestamps(hours):
+    return pd.to_datetime(hours * 3600, unit="s", utc=True)
+
+
+class HourlyStore:
+    """
+    One float64 for every hour from first_hour on, at position (hour - first_hour).
+
+    The values are memory mapped from a file rather than read into each process, so every worker
+    on the machine shares the same pages, and a range of hours is a slice rather than a search.
+    Hours with no row are marked in a validity bitmap. A duplicated hour keeps its last value.
+    """
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.version = meta["version"]
+        self.first_hour = meta["first_hour"]
+        self.hours = meta["hours"]
+        if self.hours == 0:
+            # Empty files can't be mapped
+            self.values = np.empty(0)
+            self._valid = np.empty(0, dtype="uint8")
+        else:
+            self.values = np.memmap(os.path.join(directory, meta["values"]),
+                                    dtype="float64", mode="r", shape=(self.hours,))
+            self._valid = np.memmap(os.path.join(directory, meta["valid"]),
+                                    dtype="uint8", mode="r")
+
+    @classmethod
+    def open(cls, directory):
+        # None if nothing has been written yet
+        for attempt in range(OPEN_ATTEMPTS):
+            try:
+                with open(os.path.join(directory, META_FILE)) as f:
+                    meta = json.load(f)
+            except FileNotFoundError:
+                return None
+            try:
+                return cls(directory, meta)
+            except FileNotFoundError:
+                # Two writes went by since meta.json was read, it points somewhere new now
+                if attempt == OPEN_ATTEMPTS - 1:
+                    raise
+
+    @classmethod
+    def write(cls, directory, hours, values, version):
+        """
+        Replace the store with `values` at `hours` (epoch hours).
+        Processes with the old files mapped keep reading them until they reopen.
+        Writers take turns, and the files written before this keep until the next write,
+        so a reader that has just read meta.json can still map what it points to.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return cls._write(directory, hours, values, version)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @classmethod
+    def _write(cls, directory, hours, values, version):
+        hours = np.asarray(hours, dtype="int64")
+        first_hour = int(hours.min()) if len(hours) > 0 else 0
+        count = int(hours.max()) - first_hour + 1 if len(hours) > 0 else 0
+
+        dense = np.full(count, np.nan)
+        dense[hours - first_hour] = values
+        valid = np.zeros(count, dtype=bool)
+        valid[hours - first_hour] = True
+
+        name = uuid.uuid4().hex
+        meta = {
+            "version": version,
+            "first_hour": first_hour,
+            "hours": count,
+            "values": name + ".values",
+            "valid": name + ".valid"
+        }
+        dense.tofile(os.path.join(directory, meta["values"]))
+        np.packbits(valid, bitorder="little").tofile(
+            os.path.join(directory, meta["valid"]))
+
+        keep = (META_FILE, LOCK_FILE, name)
+        try:
+            with open(os.path.join(directory, META_FILE)) as f:
+                keep += (json.load(f)["values"].split(".")[0],)
+        except FileNotFoundError:
+            pass
+
+        # Readers only ever see a complete store, the metadata is swapped in last
+        temporary = os.path.join(directory, name + ".json")
+        with open(temporary, "w") as f:
+            json.dump(meta, f)
+        os.replace(temporary, os.path.join(directory, META_FILE))
+
+        for file in os.listdir(directory):
+            if not file.startswith(keep):
+                try:
+                    os.remove(os.path.join(directory, file))
+                except OSError:
+                    pass
+
+        return cls(directory, meta)
+
+    def valid(self, start, end):
+        # Validity of positions start to end, unpacking only the bytes that cover them
+        if end <= start:
+            return np.zeros(0, dtype=bool)
+        bits = np.unpackbits(
+            self._valid[start // 8:(end + 7) // 8], bitorder="little")
+        offset = start % 8
+        return bits[offset:offset + end - start].astype(bool)
+
+    def slice(self, first_hour, end_hour):
+        """
+        (epoch hours, values, valid) from first_hour up to but not including end_hour.
+        The values are a view onto the mapped file, nothing is copied.
+        """
+        start = min(max(first_hour - self.first_hour, 0), self.hours)
+        end = min(max(end_hour - self.first_hour, start), self.hours)
+        hours = np.arange(start, end, dtype="int64") + self.first_hour
+        return hours, self.values[start:end], self.valid(start, end)
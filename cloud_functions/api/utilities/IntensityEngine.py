@@ -0,0 +1,128 @@
+import os
+import time
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from .cube import GRAIN, aggregate
+from .HourlyStore import HourlyStore, epoch_hours, hour_timestamps
+
+# Seconds between checks for newly scraped data, the copy is only reloaded when the table has changed
+IN_PROCESS_CHECK_SECONDS = float(
+    os.environ.get("IN_PROCESS_CHECK_SECONDS", 5 * 60))
+# Where each utility's HourlyStore is kept, shared by every process on the machine
+IN_PROCESS_STORE_DIR = os.environ.get(
+    "IN_PROCESS_STORE_DIR", os.path.join(tempfile.gettempdir(), "intensity_store"))
+
+HOURS_PER_DAY = 24
+# Hours turned into rows at a time when streaming, so a long range is never built all at once
+STREAM_CHUNK_HOURS = 7 * HOURS_PER_DAY
+
+
+class IntensityEngine:
+    """
+    Answers a utility's historic and average intensity requests without querying.
+
+    A copy of the hourly generation is read once, the (hours x sources) matrix multiplied by
+    the factor vector from get_carbon_intensity_factors, and the result written to an HourlyStore.
+    A date range is then a slice of the store, the intensity cube a group by over it.
+    Other processes find the store already written for the same version and just map it.
+    """
+
+    def __init__(self, api, check_seconds=IN_PROCESS_CHECK_SECONDS, store_dir=None, clock=time.monotonic):
+        self.api = api
+        self.check_seconds = check_seconds
+        self.store_dir = os.path.join(
+            store_dir or IN_PROCESS_STORE_DIR, api.utility)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._store = None
+        self._next_check = 0
+
+    def _version(self):
+        # New data or new factors both change every value
+        return "{}/{}".format(self.api._generation_version(), self.api.factor_version())
+
+    def _load(self, version):
+        start = time.perf_counter()
+        df = self.api._read_generation()
+        _, intensity = self.api._intensity_from_generation(
+            self.api._generation_matrix(df))
+        store = HourlyStore.write(
+            self.store_dir, epoch_hours(df["datetime"]), intensity, version)
+        print("Stored {} hours of {} in {:.0f}ms".format(
+            store.hours, self.api.utility, (time.perf_counter() - start) * 1000))
+        return store
+
+    def _current(self):
+        store = self._store
+        if store is not None and self._clock() < self._next_check:
+            return store
+
+        with self._lock:
+            if self._store is not None and self._clock() < self._next_check:
+                return self._store
+            try:
+                version = self._version()
+                if self._store is None or self._store.version != version:
+                    store = HourlyStore.open(self.store_dir)
+                    if store is None or store.version != version:
+                        store = self._load(version)
+                    self._store = store
+            except Exception as e:
+                if self._store is None:
+                    raise
+                print("Couldn't refresh {}, keeping the stored copy: {}".format(
+                    self.api.utility, e))
+            self._next_check = self._clock() + self.check_seconds
+            return self._store
+
+    def _slices(self, days, chunk_hours=None):
+        # (hours, values) with data for a sorted list of days, chunk_hours at a time or all at once
+        store = self._current()
+        wanted = np.array(days, dtype="datetime64[D]").astype("int64")
+        start = wanted[0] * HOURS_PER_DAY
+        end = (wanted[-1] + 1) * HOURS_PER_DAY
+        sparse = len(wanted) != wanted[-1] - wanted[0] + 1
+        step = chunk_hours or end - start
+
+        for first in range(start, end, step):
+            hours, values, valid = store.slice(first, min(first + step, end))
+            if sparse:
+                valid &= np.isin(hours // HOURS_PER_DAY, wanted)
+            yield hours[valid], values[valid]
+
+    def historic_intensity(self, days):
+        # Same columns as the historic_intensity query, for a sorted list of days
+        hours, values = next(self._slices(days))
+        return pd.DataFrame({
+            "timestamp": hour_timestamps(hours),
+            "carbon_intensity": values
+        })
+
+    def stream_historic_intensity(self, days, chunk_hours=STREAM_CHUNK_HOURS):
+        # The same rows as historic_intensity, one at a time
+        for hours, values in self._slices(days, chunk_hours):
+            for timestamp, value in zip(hour_timestamps(hours), values.tolist()):
+                yield {"timestamp": timestamp, "carbon_intensity": value}
+
+    def cube(self):
+        # Same columns as the intensity_cube table
+        store = self._current()
+        hours, values, valid = store.slice(
+            store.first_hour, store.first_hour + store.hours)
+        timestamps = pd.DatetimeIndex(hour_timestamps(hours[valid]))
+        intensity = np.asarray(values[valid])
+
+        hours = pd.DataFrame({
+            # Same parts as EXTRACT in BigQuery, in UTC and with Sunday as day 1
+            "year": timestamps.year,
+            "month": timestamps.month,
+            "dayofweek": (timestamps.dayofweek + 1) % 7 + 1,
+            "hour": timestamps.hour,
+            "intensity_sum": intensity,
+            "hour_count": ~np.isnan(intensity)
+        })
+        cube = aggregate(hours, GRAIN)
+        cube.loc[cube["hour_count"] == 0, "intensity_sum"] = np.nan
+        return cube
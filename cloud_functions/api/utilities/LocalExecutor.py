@@ -0,0 +1,159 @@
+import os
+import re
+import threading
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+from .QueryBackend import QueryBackend, UnsupportedQuery
+
+# `japan-grid-carbon-api[-staging].{dataset}.{table}`, quoted or not
+TABLE_REFERENCE = re.compile(
+    r"`?japan-grid-carbon-api(?:-staging)?\.(\w+)\.(\w+)`?")
+
+# BigQuery functions DuckDB doesn't share, (pattern, replacement) applied in order
+DIALECT = (
+    # BigQuery numbers days from Sunday = 1, DuckDB from Sunday = 0
+    (re.compile(r"EXTRACT\(DAYOFWEEK FROM ([^()]+)\)", re.IGNORECASE),
+     r"(EXTRACT(DOW FROM \1) + 1)"),
+    (re.compile(r"EXTRACT\(DATE FROM ([^()]+)\)", re.IGNORECASE),
+     r"CAST(\1 AS DATE)"),
+    (re.compile(r"\bTIMESTAMP\(", re.IGNORECASE), "bq_timestamp("),
+    (re.compile(r"\bIN UNNEST\((@\w+)\)", re.IGNORECASE), r"IN (SELECT UNNEST(\1))"),
+    (re.compile(r"@(\w+)"), r"$\1"),
+)
+
+# Only BigQuery can train or run the models
+UNSUPPORTED = re.compile(r"\bML\.|\bCREATE\b", re.IGNORECASE)
+
+FILE_READERS = (
+    (".parquet", "read_parquet"),
+    (".csv", "read_csv_auto"),
+)
+
+
+def available():
+    return duckdb is not None
+
+
+def view_name(dataset, table):
+    return dataset + "__" + table
+
+
+def translate(query):
+    """
+    The subset of BigQuery SQL that UtilityAPI uses, rewritten for DuckDB.
+    Returns the query and the (dataset, table) pairs it reads.
+    """
+    if UNSUPPORTED.search(query):
+        raise UnsupportedQuery(
+            "Models and statements only run on BigQuery: " + query.strip().split("\n")[0])
+
+    tables = set()
+
+    def table_view(match):
+        tables.add((match.group(1), match.group(2)))
+        return view_name(match.group(1), match.group(2))
+
+    query = TABLE_REFERENCE.sub(table_view, query)
+    for pattern, replacement in DIALECT:
+        query = pattern.sub(replacement, query)
+    return query, tables
+
+
+class LocalExecutor(QueryBackend):
+    """
+    Runs UtilityAPI's queries with an embedded DuckDB instead of BigQuery.
+
+    Each table is read from {data_dir}/{dataset}/{table}.parquet (or .csv),
+    e.g. the CSVs the scraper uploads to Cloud Storage. Files carry no table labels,
+    so carbon intensities are always calculated from the hourly generation data.
+    """
+    name = "Local"
+
+    def __init__(self, data_dir, **kwargs):
+        super().__init__(**kwargs)
+        if duckdb is None:
+            raise ImportError("The local query backend needs duckdb installed")
+        self.data_dir = data_dir
+        self._connection = duckdb.connect()
+        self._connection.execute(
+            "CREATE MACRO bq_timestamp(value) AS CAST(value AS TIMESTAMP)")
+        self._views = set()
+        self._views_lock = threading.Lock()
+
+    def _table_file(self, dataset, table):
+        for extension, reader in FILE_READERS:
+            path = os.path.join(self.data_dir, dataset, table + extension)
+            if os.path.exists(path):
+                return path, reader
+        raise FileNotFoundError(
+            "No local data for {}.{} in {}".format(dataset, table, self.data_dir))
+
+    def _create_views(self, tables):
+        with self._views_lock:
+            for dataset, table in tables:
+                if (dataset, table) in self._views:
+                    continue
+                path, reader = self._table_file(dataset, table)
+                self._connection.execute("CREATE OR REPLACE VIEW {view} AS SELECT * FROM {reader}('{path}')".format(
+                    view=view_name(dataset, table),
+                    reader=reader,
+                    path=path.replace("'", "''")
+                ))
+                self._views.add((dataset, table))
+
+    def _run(self, query, params):
+        query, tables = translate(query)
+        self._create_views(tables)
+        # DuckDB connections aren't shared between threads, each query gets its own cursor
+        cursor = self._connection.cursor()
+        cursor.execute(query, params or {})
+        return cursor
+
+    def query(self, query, label="query", page_size=None, params=None):
+        start = self._clock()
+        try:
+            cursor = self._run(query, params)
+        finally:
+            self._record(label, self._clock() - start)
+        return self._rows(cursor, page_size or 1000)
+
+    def _rows(self, cursor, page_size):
+        columns = [column[0] for column in cursor.description]
+        try:
+            while True:
+                page = cursor.fetchmany(page_size)
+                if not page:
+                    return
+                for row in page:
+                    yield dict(zip(columns, row))
+        finally:
+            cursor.close()
+
+    def read_dataframe(self, query, label="query", params=None):
+        start = self._clock()
+        try:
+            cursor = self._run(query, params)
+            df = cursor.df()
+            cursor.close()
+        finally:
+            self._record(label, self._clock() - start)
+        return df
+
+    def execute(self, query, label="query"):
+        start = self._clock()
+        try:
+            self._run(query, None).close()
+        finally:
+            self._record(label, self._clock() - start)
+
+    def table_labels(self, table_id):
+        return {}
+
+    def table_version(self, table_id):
+        match = TABLE_REFERENCE.fullmatch(table_id)
+        path, reader = self._table_file(match.group(1), match.group(2))
+        return os.path.getmtime(path)
@@ -0,0 +1,66 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+
+
+class UnsupportedQuery(Exception):
+    # A query this backend can't run, e.g. BigQuery ML on the local backend
+    pass
+
+
+class QueryBackend(ABC):
+    """
+    What UtilityAPI needs from wherever the data lives.
+
+    Queries are written in BigQuery's dialect with @name parameters, each backend runs them
+    and records how long they took under the given label. Queries a backend can't run raise UnsupportedQuery.
+    """
+    name = "Query"
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._latencies = {}
+
+    @abstractmethod
+    def query(self, query, label="query", page_size=None, params=None):
+        # An iterable of rows that can be indexed by column name
+        pass
+
+    @abstractmethod
+    def read_dataframe(self, query, label="query", params=None):
+        pass
+
+    @abstractmethod
+    def execute(self, query, label="query"):
+        # Statements with no rows to return, e.g. CREATE MODEL
+        pass
+
+    @abstractmethod
+    def table_labels(self, table_id):
+        # {} when the table has no labels
+        pass
+
+    @abstractmethod
+    def table_version(self, table_id):
+        # Changes whenever the table's data is replaced or added to
+        pass
+
+    def _record(self, label, elapsed):
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            latency = self._latencies.get(label)
+            if latency is None:
+                latency = {"count": 0, "total_ms": 0.0,
+                           "max_ms": 0.0, "last_ms": 0.0}
+                self._latencies[label] = latency
+            latency["count"] += 1
+            latency["total_ms"] += elapsed_ms
+            latency["max_ms"] = max(latency["max_ms"], elapsed_ms)
+            latency["last_ms"] = elapsed_ms
+        print("{} {}: {:.0f}ms".format(self.name, label, elapsed_ms))
+
+    def stats(self):
+        with self._lock:
+            return {label: dict(latency, mean_ms=latency["total_ms"] / latency["count"])
+                    for label, latency in self._latencies.items()}
@@ -1,10 +1,28 @@
-import pandas as pd
-import requests
-import json
-from google.cloud import bigquery
 import os
+import json
+import hashlib
+import numpy as np
+from datetime import date
+from ..cache.shared import response_cache, data_versions
+from ..cache.DayChunks import fetch_by_day, is_contiguous, days_in_range
+from ..cache.Freshness import range_ttl, forecast_ttl
+from .columnar import to_columns
+from .cube import GRAIN, rollup
+from .IntensityEngine import IntensityEngine
+from .backends import executor
 stage = os.environ['STAGE']
 
+# Rows fetched from BigQuery per page when streaming, bounds how much of a result is held at once
+STREAM_PAGE_SIZE = int(os.environ.get("STREAM_PAGE_SIZE", 5000))
+
+# Set to 1 to read the carbon_intensity column the scraper stores, when it was made with the current factors
+MATERIALIZED_INTENSITY = os.environ.get("MATERIALIZED_INTENSITY") == "1"
+# Utilities answered from an in-process copy of their hourly data rather than by querying, or "all"
+IN_PROCESS_UTILITIES = os.environ.get("IN_PROCESS_UTILITIES", "").split(",")
+
+# Table label recording the factor_version the stored carbon_intensity was calculated with
+FACTOR_VERSION_LABEL = "carbon_intensity_version"
+
 HORIZON = 2500
 # Bit more than than 3 months of hours (24h * 31d * 3m = 2322)
 
@@ -21,160 +39,331 @@ national_lifecycle_carbon_intensities_by_source = {
     "biomass": 120  # Still use the UK factor
 }
 
+# Generation source -> (column in historical_data_by_generation_type, column used in the intensity calculation, intensity factor)
+#   columns are prefixed with the utility's unit, daMWh_ or MWh_
+#   pumped storage and interconnectors only count when they supply power, so use their positive part
+GENERATION_COLUMNS = {
+    "nuclear": ("nuclear", "nuclear", "kWh_nuclear"),
+    "fossil": ("fossil", "fossil", "kWh_fossil"),
+    "hydro": ("hydro", "hydro", "kWh_hydro"),
+    "geothermal": ("geothermal", "geothermal", "kWh_geothermal"),
+    "biomass": ("biomass", "biomass", "kWh_biomass"),
+    "solar_output": ("solar_output", "solar_output", "kWh_solar_output"),
+    "wind_output": ("wind_output", "wind_output", "kWh_wind_output"),
+    "pumped_storage": ("pumped_storage", "pumped_storage_contribution", "kWh_pumped_storage"),
+    "interconnectors": ("interconnectors", "interconnector_contribution", "kWh_interconnectors"),
+}
+
 
 class UtilityAPI:
+    # The shape of each utility's historical_data_by_generation_type table
+    column_prefix = "daMWh"
+    generation_sources = tuple(GENERATION_COLUMNS)
+    # Return 0 rather than divide by an hour with no recorded generation
+    guard_zero_generation = False
+
     def __init__(self, utility, config):
         self.utility = utility
         self.bqStageName = "" if stage == "production" else "-staging"
         self.config = config
-
-    def _get_intensity_query_string(self):
-        query_string = """
-        AVG(
-            {intensity_calc}
-        ) as carbon_intensity
-        FROM (
-            {from_string}
-        )
-        """.format(
-            from_string=self._pumped_storage_calc_query_string(),
-            intensity_calc=self._carbon_intensity_query_string()
-        )
-        return query_string
-
-    def _pumped_storage_calc_query_string(self):
-        return """
-            SELECT *,
-            (daMWh_nuclear + daMWh_fossil + daMWh_hydro + daMWh_geothermal + daMWh_biomass + daMWh_solar_output + daMWh_wind_output + daMWh_pumped_storage_contribution + daMWh_interconnector_contribution) as daMWh_total_generation
-            FROM (
-                SELECT *,
-                if(daMWh_interconnectors > 0,daMWh_interconnectors, 0) as daMWh_interconnector_contribution,
-                if(daMWh_pumped_storage > 0,daMWh_pumped_storage, 0) as daMWh_pumped_storage_contribution,
-                FROM `japan-grid-carbon-api{bqStageName}.{utility}.historical_data_by_generation_type`
-            )
-        """.format(
+        # Rendered SQL fragments, these only depend on the utility and its config
+        self._fragments = {}
+        self._carbon_intensity_factors = None
+        self._materialized = None
+        self._engine = None
+
+    def warm(self):
+        # Precompute what doesn't change between requests. Runs inside the registry's lock, so nothing here
+        #   may query, whether the stored intensities can be used is found out on the first query instead
+        self.get_carbon_intensity_factors()
+
+    def _fragment(self, name, build):
+        fragment = self._fragments.get(name)
+        if fragment is None:
+            fragment = build()
+            self._fragments[name] = fragment
+        return fragment
+
+    def _from_string(self):
+        if self._uses_materialized_intensity():
+            return self._fragment("from_string", self._materialized_query_string)
+        return self._fragment("from_string", self._pumped_storage_calc_query_string)
+
+    def _intensity_calc(self):
+        if self._uses_materialized_intensity():
+            return "carbon_intensity"
+        return self._fragment("intensity_calc", self._carbon_intensity_query_string)
+
+    def _in_process(self):
+        return self.utility in IN_PROCESS_UTILITIES or "all" in IN_PROCESS_UTILITIES
+
+    def engine(self):
+        if self._engine is None:
+            self._engine = IntensityEngine(self)
+        return self._engine
+
+    def _uses_materialized_intensity(self):
+        # Decided once per process, the formula is always right so it is used whenever there's any doubt
+        if self._materialized is None:
+            self._materialized = False
+            if MATERIALIZED_INTENSITY:
+                self._materialized = self._is_current("historical_data_by_generation_type")
+        return self._materialized
+
+    def _table_id(self, table_name):
+        return "japan-grid-carbon-api{bqStageName}.{utility}.{table_name}".format(
             bqStageName=self.bqStageName,
-            utility=self.utility
+            utility=self.utility,
+            table_name=table_name
         )
 
-    def _carbon_intensity_query_string(self):
-        ci = self.get_carbon_intensity_factors()
-
-        return """
-        (
-            (daMWh_nuclear * {intensity_nuclear}) +
-            (daMWh_fossil * {intensity_fossil}) +
-            (daMWh_hydro * {intensity_hydro}) +
-            (daMWh_geothermal * {intensity_geothermal}) +
-            (daMWh_biomass * {intensity_biomass}) +
-            (daMWh_solar_output * {intensity_solar_output}) +
-            (daMWh_wind_output * {intensity_wind_output}) +
-            (daMWh_pumped_storage_contribution * {intensity_pumped_storage}) +
-            (daMWh_interconnector_contribution * {intensity_interconnectors})
-        ) / daMWh_total_generation
-        """.format(
-            intensity_nuclear=ci["kWh_nuclear"],
-            intensity_fossil=ci["kWh_fossil"],
-            intensity_hydro=ci["kWh_hydro"],
-            intensity_geothermal=ci["kWh_geothermal"],
-            intensity_biomass=ci["kWh_biomass"],
-            intensity_solar_output=ci["kWh_solar_output"],
-            intensity_wind_output=ci["kWh_wind_output"],
-            intensity_pumped_storage=ci["kWh_pumped_storage"],
-            intensity_interconnectors=ci["kWh_interconnectors"]
+    def _historical_table_id(self):
+        return self._table_id("historical_data_by_generation_type")
+
+    def _stored_factor_version(self, table_name="historical_data_by_generation_type"):
+        return executor.table_labels(self._table_id(table_name)).get(FACTOR_VERSION_LABEL)
+
+    def _is_current(self, table_name):
+        # Whether the intensities stored in table_name were calculated with this utility's factors
+        try:
+            return self._stored_factor_version(table_name) == self.factor_version()
+        except Exception as e:
+            print("Couldn't check stored carbon intensity in {} for {}: {}".format(
+                table_name, self.utility, e))
+            return False
+
+    def _cube_is_current(self):
+        # Built with this utility's factors, and since the hourly data was last replaced
+        if not self._is_current("intensity_cube"):
+            return False
+        try:
+            return executor.table_version(self._table_id("intensity_cube")) >= self._generation_version()
+        except Exception as e:
+            print("Couldn't compare the intensity cube with the hourly data for {}: {}".format(
+                self.utility, e))
+            return False
+
+    def _read_generation(self):
+        # Everything the intensity calculation needs from the hourly table, for IntensityEngine
+        return executor.read_dataframe(
+            "SELECT {columns} FROM `{table_id}` order by datetime".format(
+                columns=", ".join(self._table_columns()),
+                table_id=self._historical_table_id()
+            ),
+            label="generation"
         )
 
-    def _extract_daily_carbon_intensity_from_big_query(self):
+    def _generation_version(self):
+        return executor.table_version(self._historical_table_id())
 
-        query = """
-        SELECT
-        EXTRACT(HOUR FROM datetime) AS hour,
-        """ + self._get_intensity_query_string() + """
-        GROUP BY hour
-        order by hour asc
+    def _materialized_query_string(self):
+        return """
+            SELECT
+            datetime,
+            carbon_intensity
+            FROM `{table_id}`
+        """.format(table_id=self._historical_table_id())
+
+    def factor_version(self):
+        # Changes whenever anything that goes into the carbon intensity calculation does
+        inputs = json.dumps({
+            "national": national_lifecycle_carbon_intensities_by_source,
+            "factors": self.get_carbon_intensity_factors(),
+            "column_prefix": self.column_prefix,
+            "generation_sources": self.generation_sources,
+            "guard_zero_generation": self.guard_zero_generation
+        }, sort_keys=True)
+        return hashlib.blake2b(inputs.encode("utf-8"), digest_size=8).hexdigest()
+
+    def calculate_carbon_intensity(self, df):
         """
-
-        return pd.read_gbq(query)
-
-    def _extract_daily_carbon_intensity_by_year_from_big_query(self):
-
-        query = """
-        SELECT
-        EXTRACT(YEAR from datetime) as year,
-        EXTRACT(HOUR FROM datetime) AS hour,
-        """ + self._get_intensity_query_string() + """
-        GROUP BY year, hour
-        order by year, hour asc
+        The carbon_intensity and total_generation for each row of historical_data_by_generation_type,
+        the same formula as _carbon_intensity_query_string uses in SQL.
+        Hours with no generation are 0 when guard_zero_generation is set and null otherwise.
         """
+        total_generation, carbon_intensity = self._intensity_from_generation(
+            self._generation_matrix(df))
 
-        return pd.read_gbq(query)
+        return df.assign(
+            total_generation=total_generation,
+            carbon_intensity=carbon_intensity
+        )
 
-    def _extract_daily_carbon_intensity_by_month_from_big_query(self):
+    def _generation_matrix(self, df):
+        # (hours x generation_sources), pumped storage and interconnectors only count what they supply
+        matrix = np.empty((len(df.index), len(self.generation_sources)))
+        for i, source in enumerate(self.generation_sources):
+            table_column, column, factor = GENERATION_COLUMNS[source]
+            matrix[:, i] = df[self._column(table_column)].to_numpy(dtype="float64")
+            if table_column != column:
+                np.maximum(matrix[:, i], 0, out=matrix[:, i])
+        return matrix
+
+    def _factor_vector(self):
+        ci = self.get_carbon_intensity_factors()
+        return np.array([ci[GENERATION_COLUMNS[source][2]] for source in self.generation_sources])
 
-        query = """
-        SELECT
-        EXTRACT(MONTH FROM datetime) AS month,
-        EXTRACT(HOUR FROM datetime) AS hour,
-        """ + self._get_intensity_query_string() + """
-        GROUP BY month, hour
-        order by month, hour asc
-        """
+    def _intensity_from_generation(self, matrix):
+        total_generation = matrix.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            carbon_intensity = matrix.dot(self._factor_vector()) / total_generation
+        carbon_intensity[total_generation == 0] = np.nan
+        if self.guard_zero_generation:
+            carbon_intensity[~(total_generation > 0)] = 0
+        return total_generation, carbon_intensity
 
-        return pd.read_gbq(query)
+    def _column(self, name):
+        return self.column_prefix + "_" + name
 
-    def _extract_daily_carbon_intensity_by_month_and_year_from_big_query(self):
+    def _table_columns(self):
+        # The only columns any intensity query reads from historical_data_by_generation_type
+        return ["datetime"] + [self._column(GENERATION_COLUMNS[source][0]) for source in self.generation_sources]
 
-        query = """
-        SELECT
-        EXTRACT(MONTH FROM datetime) AS month,
-        EXTRACT(YEAR FROM datetime) AS year,
-        EXTRACT(HOUR FROM datetime) AS hour,
-        """ + self._get_intensity_query_string() + """
-        GROUP BY year, month, hour
-        order by year, month, hour asc
-        """
+    def _pumped_storage_calc_query_string(self):
+        projection = ["datetime"]
+        for source in self.generation_sources:
+            table_column, column, factor = GENERATION_COLUMNS[source]
+            if table_column == column:
+                projection.append(self._column(column))
+            else:
+                projection.append("if({table} > 0, {table}, 0) as {column}".format(
+                    table=self._column(table_column),
+                    column=self._column(column)
+                ))
+
+        total_generation = " + ".join(
+            self._column(GENERATION_COLUMNS[source][1]) for source in self.generation_sources)
 
-        return pd.read_gbq(query)
+        return """
+            SELECT *,
+            ({total_generation}) as {prefix}_total_generation
+            FROM (
+                SELECT
+                {projection}
+                FROM `{table_id}`
+            )
+        """.format(
+            total_generation=total_generation,
+            prefix=self.column_prefix,
+            projection=",\n                ".join(projection),
+            table_id=self._historical_table_id()
+        )
 
-    def _extract_daily_carbon_intensity_by_month_and_weekday_from_big_query(self):
+    def _carbon_intensity_query_string(self):
+        ci = self.get_carbon_intensity_factors()
 
-        query = """
-        SELECT
-        EXTRACT(MONTH FROM datetime) AS month,
-        EXTRACT(DAYOFWEEK FROM datetime) AS dayofweek,
-        EXTRACT(HOUR FROM datetime) AS hour,
-        """ + self._get_intensity_query_string() + """
-        GROUP BY month, dayofweek, hour
-        order by month, dayofweek, hour asc
-        """
+        intensity = """(
+            {terms}
+        ) / {prefix}_total_generation""".format(
+            terms=" +\n            ".join(
+                "({column} * {factor})".format(
+                    column=self._column(GENERATION_COLUMNS[source][1]),
+                    factor=ci[GENERATION_COLUMNS[source][2]]
+                ) for source in self.generation_sources),
+            prefix=self.column_prefix
+        )
 
-        return pd.read_gbq(query)
+        if self.guard_zero_generation:
+            intensity = "IF({prefix}_total_generation > 0, {intensity}, 0)".format(
+                prefix=self.column_prefix,
+                intensity=intensity
+            )
 
-    def _extract_daily_carbon_intensity_by_month_and_year_from_big_query(self):
+        return """
+        {intensity}
+        """.format(intensity=intensity)
+
+    def _date_filter_string(self, column, gaps=False):
+        # One consolidated filter for a sorted list of days, gaps are cut out with the @days list
+        #   the range compares the column itself to constants, so only the partitions for those days are scanned
+        query_string = '{column} >= TIMESTAMP(@first_day) AND {column} < TIMESTAMP(DATE_ADD(@last_day, INTERVAL 1 DAY))'.format(
+            column=column
+        )
+        if gaps:
+            query_string += " AND EXTRACT(DATE from {column}) IN UNNEST(@days)".format(
+                column=column
+            )
+        return query_string
 
-        query = """
+    def _intensity_cube_query_string(self):
+        # Sums and counts rather than averages, so any coarser breakdown can be rolled up exactly
+        return """
         SELECT
-        EXTRACT(MONTH FROM datetime) AS month,
         EXTRACT(YEAR FROM datetime) AS year,
+        EXTRACT(MONTH FROM datetime) AS month,
         EXTRACT(DAYOFWEEK FROM datetime) AS dayofweek,
         EXTRACT(HOUR FROM datetime) AS hour,
-        """ + self._get_intensity_query_string() + """
+        SUM(carbon_intensity) as intensity_sum,
+        COUNT(carbon_intensity) as hour_count
+        FROM (
+            SELECT
+            datetime,
+            {intensity_calc}
+            as carbon_intensity
+            FROM (
+                {from_string}
+            )
+        )
         GROUP BY year, month, dayofweek, hour
         order by year, month, dayofweek, hour asc
-        """
+        """.format(
+            from_string=self._from_string(),
+            intensity_calc=self._intensity_calc()
+        )
+
+    def _query_intensity_cube(self):
+        if self._in_process():
+            return self.engine().cube()
+        if self._cube_is_current():
+            return executor.read_dataframe(
+                "SELECT * FROM `{table_id}`".format(
+                    table_id=self._table_id("intensity_cube")),
+                label="intensity_cube"
+            )
+        # Not built yet, built with other factors or from older data, so work it out from the hours like the scraper does
+        return executor.read_dataframe(
+            self._fragment("intensity_cube_query",
+                           self._intensity_cube_query_string),
+            label="intensity_cube_from_hours"
+        )
 
-        return pd.read_gbq(query)
+    def _intensity_cube(self):
+        # One read shared by every breakdown until it expires
+        key = data_versions.key((self.utility, "intensity_cube"))
+        cube = response_cache.get(key)
+        if cube is None:
+            cube = self._query_intensity_cube()
+            response_cache.set(key, cube)
+        return cube
+
+    def _average_intensity(self, *by):
+        return rollup(self._intensity_cube(), by)
+
+    def _date_parameters(self, days):
+        # Query parameters for _date_filter_string
+        dates = [date.fromisoformat(day) for day in days]
+        params = {"first_day": dates[0], "last_day": dates[-1]}
+        if not is_contiguous(days):
+            params["days"] = dates
+        return params
 
     def _extract_prediction_from_big_query_by_weekday_month_and_year(self, year):
+        return executor.read_dataframe(
+            self._fragment("prediction_query",
+                           self._prediction_query_string),
+            label="prediction_for_year",
+            params={"year": int(year)}
+        )
 
-        query = """
+    def _prediction_query_string(self):
+        return """
         SELECT
         predicted_carbon_intensity, year, dayofweek, month, hour
         FROM
         ML.PREDICT(MODEL `japan-grid-carbon-api{bqStageName}.{utility}.year_month_dayofweek_model`,
             (
             SELECT
-                {year} AS year,
+                @year AS year,
                 EXTRACT(DAYOFWEEK FROM datetime) AS dayofweek,
                 EXTRACT(MONTH FROM datetime) AS month,
                 EXTRACT(HOUR FROM datetime) AS hour,
@@ -185,14 +374,18 @@ class UtilityAPI:
         order by month, dayofweek, hour asc
         """.format(
                 bqStageName=self.bqStageName,
-                utility=self.utility,
-                year=year
+                utility=self.utility
         )
 
-        return pd.read_gbq(query)
-
     def _query_timeseries_model(self):
-        query = """
+        return executor.read_dataframe(
+            self._fragment("timeseries_model_query",
+                           self._timeseries_model_query_string),
+            label="timeseries_model"
+        )
+
+    def _timeseries_model_query_string(self):
+        return """
         SELECT
         *
         FROM
@@ -206,11 +399,18 @@ class UtilityAPI:
             horizon_size=HORIZON
         )
 
-        return pd.read_gbq(query)
+    def _query_intensity_forecast(self, days):
+        gaps = not is_contiguous(days)
+        return executor.read_dataframe(
+            self._fragment("forecast_query_gaps" if gaps else "forecast_query",
+                           lambda: self._intensity_forecast_query_string(gaps)),
+            label="intensity_forecast",
+            params=self._date_parameters(days)
+        )
 
-    def _query_intensity_forecast(self, from_date, to_date):
+    def _intensity_forecast_query_string(self, gaps):
         # Self Join on Table to return the most recently dated intensity forecast
-        query = """
+        return """
         SELECT 
             a.*
         FROM `japan-grid-carbon-api{bqStageName}.{utility}.intensity_forecast` as a
@@ -221,19 +421,21 @@ class UtilityAPI:
             FROM `japan-grid-carbon-api{bqStageName}.{utility}.intensity_forecast`
             GROUP BY forecast_timestamp
         ) b ON a.forecast_timestamp = b.forecast_timestamp AND a.date_created = b.most_recent_forecast_date
-        WHERE EXTRACT(DATE from a.forecast_timestamp) BETWEEN DATE("{from_date}") and DATE("{to_date}")
+        WHERE {date_filter}
         order by a.forecast_timestamp
         """.format(
             bqStageName=self.bqStageName,
             utility=self.utility,
-            from_date=from_date,
-            to_date=to_date
+            date_filter=self._date_filter_string("a.forecast_timestamp", gaps)
         )
 
-        return pd.read_gbq(query)
+    def _historic_intensity_query(self, days):
+        gaps = not is_contiguous(days)
+        return self._fragment("historic_query_gaps" if gaps else "historic_query",
+                              lambda: self._historic_intensity_query_string(gaps))
 
-    def historic_intensity(self, from_date, to_date):
-        query = """
+    def _historic_intensity_query_string(self, gaps):
+        return """
         SELECT
         datetime as timestamp,
         {intensity_calc}
@@ -241,16 +443,58 @@ class UtilityAPI:
         FROM (
             {from_string}
         )
-        WHERE EXTRACT(DATE from datetime) BETWEEN DATE("{from_date}") and DATE("{to_date}")
+        WHERE {date_filter}
         order by datetime
         """.format(
-            from_string=self._pumped_storage_calc_query_string(),
-            intensity_calc=self._carbon_intensity_query_string(),
-            from_date=from_date,
-            to_date=to_date
+            from_string=self._from_string(),
+            intensity_calc=self._intensity_calc(),
+            date_filter=self._date_filter_string("datetime", gaps)
         )
 
-        df = pd.read_gbq(query)
+    def _query_historic_intensity(self, days):
+        if self._in_process():
+            return self.engine().historic_intensity(days)
+        return executor.read_dataframe(
+            self._historic_intensity_query(days),
+            label="historic_intensity",
+            params=self._date_parameters(days)
+        )
+
+    def _stream_query(self, query, params):
+        # Rows straight from the result iterator, a page at a time, never the whole result
+        return executor.query(query, label="stream_historic_intensity", page_size=STREAM_PAGE_SIZE, params=params)
+
+    def stream_historic_intensity(self, from_date, to_date):
+        days = days_in_range(from_date, to_date)
+        if self._in_process():
+            rows = self.engine().stream_historic_intensity(days)
+        else:
+            rows = self._stream_query(
+                self._historic_intensity_query(days), self._date_parameters(days))
+        for row in rows:
+            yield {
+                "timestamp": str(row["timestamp"]),
+                "carbon_intensity": row["carbon_intensity"]
+            }
+
+    def historic_intensity_frame(self, from_date, to_date):
+        return fetch_by_day(
+            response_cache,
+            data_versions.key((self.utility, "historic_day")),
+            from_date,
+            to_date,
+            self._query_historic_intensity,
+            'timestamp',
+            ttl=lambda day, df: range_ttl(day)
+        )
+
+    def historic_intensity(self, from_date, to_date, layout="records", timestamps="iso"):
+        df = self.historic_intensity_frame(from_date, to_date)
+
+        if layout == "columnar":
+            return {"historic": to_columns(
+                df[['timestamp', 'carbon_intensity']], ('timestamp',), timestamps)}
+
         df['timestamp'] = df['timestamp'].astype(str)
 
         output = {"historic":
@@ -259,9 +503,15 @@ class UtilityAPI:
 
         return output
 
-    def daily_intensity(self):
+    def daily_intensity(self, layout="records"):
 
-        df = self._extract_daily_carbon_intensity_from_big_query()
+        df = self._average_intensity("hour")
+
+        if layout == "columnar":
+            return {"carbon_intensity_average": {
+                "breakdown": "hour",
+                "data": to_columns(df[['hour', 'carbon_intensity']])}
+            }
 
         df.reset_index(inplace=True)
 
@@ -272,9 +522,17 @@ class UtilityAPI:
 
         return output
 
-    def daily_intensity_by_year(self):
+    def daily_intensity_by_year(self, layout="records"):
 
-        df = self._extract_daily_carbon_intensity_by_year_from_big_query()
+        df = self._average_intensity("year", "hour")
+
+        if layout == "columnar":
+            return {
+                "carbon_intensity_average": {
+                    "breakdown": 'year',
+                    "data": to_columns(df[['year', 'hour', 'carbon_intensity']])
+                }
+            }
 
         data = df.groupby('year').apply(
             lambda year: year[['hour', 'carbon_intensity']].to_dict(
@@ -293,9 +551,17 @@ class UtilityAPI:
 
         return output
 
-    def daily_intensity_by_month(self):
+    def daily_intensity_by_month(self, layout="records"):
 
-        df = self._extract_daily_carbon_intensity_by_month_from_big_query()
+        df = self._average_intensity("month", "hour")
+
+        if layout == "columnar":
+            return {
+                "carbon_intensity_average": {
+                    "breakdown": 'month',
+                    "data": to_columns(df[['month', 'hour', 'carbon_intensity']])
+                }
+            }
 
         data = df.groupby('month').apply(
             lambda year: year[['hour', 'carbon_intensity']].to_dict(
@@ -314,9 +580,12 @@ class UtilityAPI:
 
         return output
 
-    def daily_intensity_by_month_and_year(self):
+    def daily_intensity_by_month_and_year(self, layout="records"):
+
+        df = self._average_intensity("year", "month", "hour")
 
-        df = self._extract_daily_carbon_intensity_by_month_and_year_from_big_query()
+        if layout == "columnar":
+            return {"carbon_intensity_by_month_and_year": to_columns(df[['year', 'month', 'hour', 'carbon_intensity']])}
 
         df.reset_index(inplace=True)
 
@@ -332,9 +601,12 @@ class UtilityAPI:
 
         return output
 
-    def daily_intensity_by_month_and_weekday(self):
+    def daily_intensity_by_month_and_weekday(self, layout="records"):
 
-        df = self._extract_daily_carbon_intensity_by_month_and_weekday_from_big_query()
+        df = self._average_intensity("month", "dayofweek", "hour")
+
+        if layout == "columnar":
+            return {"carbon_intensity_by_month_and_weekday": to_columns(df[['month', 'dayofweek', 'hour', 'carbon_intensity']])}
 
         df.reset_index(inplace=True)
 
@@ -352,7 +624,7 @@ class UtilityAPI:
 
     def daily_intensity_by_year_month_and_weekday(self):
 
-        df = self._extract_daily_carbon_intensity_by_month_and_year_from_big_query()
+        df = self._average_intensity(*GRAIN)
 
         df.reset_index(inplace=True)
 
@@ -389,8 +661,29 @@ class UtilityAPI:
 
         return output
 
-    def timeseries_prediction(self, from_date, to_date):
-        df = self._query_intensity_forecast(from_date, to_date)
+    def timeseries_prediction_frame(self, from_date, to_date):
+        return fetch_by_day(
+            response_cache,
+            data_versions.key((self.utility, "forecast_day")),
+            from_date,
+            to_date,
+            self._query_intensity_forecast,
+            'forecast_timestamp',
+            ttl=lambda day, fetched: forecast_ttl(
+                fetched['date_created'].max() if len(fetched.index) > 0 else None)
+        )
+
+    def prediction_ttl(self, from_date, to_date):
+        # Seconds the forecast for a date range can be cached for, until the next one replaces the latest in it
+        df = self.timeseries_prediction_frame(from_date, to_date)
+        return forecast_ttl(df['date_created'].max() if len(df.index) > 0 else None)
+
+    def timeseries_prediction(self, from_date, to_date, layout="records", timestamps="iso"):
+        df = self.timeseries_prediction_frame(from_date, to_date)
+
+        if layout == "columnar":
+            return {'forecast': to_columns(
+                df, ('forecast_timestamp', 'date_created'), timestamps)}
 
         df['forecast_timestamp'] = df['forecast_timestamp'].astype(str)
         df['date_created'] = df['date_created'].astype(str)
@@ -401,9 +694,25 @@ class UtilityAPI:
 
         return output
 
-    def create_timeseries_model(self):
-        client = bigquery.Client()
+    def create_intensity_cube(self):
+        query = """
+        CREATE OR REPLACE TABLE `{table_id}`
+        OPTIONS(labels=[("{label}", "{version}")])
+        AS
+        {cube}
+        """.format(
+            table_id=self._table_id("intensity_cube"),
+            label=FACTOR_VERSION_LABEL,
+            version=self.factor_version(),
+            cube=self._intensity_cube_query_string()
+        )
+        print("Creating intensity cube for " + self.utility)
+
+        executor.execute(query, label="create_intensity_cube")
 
+        return "Success"
+
+    def create_timeseries_model(self):
         query = """
         CREATE OR REPLACE MODEL `japan-grid-carbon-api{bqStageName}.{utility}.model_intensity_timeseries`
         OPTIONS(
@@ -426,18 +735,22 @@ class UtilityAPI:
         """.format(
             bqStageName=self.bqStageName,
             utility=self.utility,
-            from_string=self._pumped_storage_calc_query_string(),
-            intensity_calc=self._carbon_intensity_query_string(),
+            from_string=self._from_string(),
+            intensity_calc=self._intensity_calc(),
             horizon_size=HORIZON
         )
         print("Creating ARIMA Timeseries model for " + self.utility)
 
-        queryJob = client.query(query)
-        result = queryJob.result()
+        executor.execute(query, label="create_timeseries_model")
 
         return "Success"
 
     def get_carbon_intensity_factors(self):
+        if self._carbon_intensity_factors is None:
+            self._carbon_intensity_factors = self._calculate_carbon_intensity_factors()
+        return dict(self._carbon_intensity_factors)
+
+    def _calculate_carbon_intensity_factors(self):
         stations = self.config["fuel_type_totals"]
         totalFossil = stations["lng"] + \
             stations["oil"] + stations["coal"]
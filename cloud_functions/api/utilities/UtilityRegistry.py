@@ -0,0 +1,71 @@
+import importlib
+import threading
+
+UTILITIES = (
+    "tepco",
+    "tohokuden",
+    "kepco",
+    "chuden",
+    "hepco",
+    "rikuden",
+    "cepco",
+    "yonden",
+    "kyuden",
+    "okiden",
+)
+
+
+class UtilityRegistry:
+    """
+    Looks up per-utility objects by name, building each one at most once per process on first use.
+
+    class_path is a dotted path to the class with {utility} and {Utility} placeholders,
+    e.g. ".{utility}.{Utility}API.{Utility}API", relative paths resolve against package.
+    on_create is called once with each new instance to precompute anything it needs.
+    """
+
+    def __init__(self, class_path, package=None, on_create=None):
+        self.class_path = class_path
+        self.package = package
+        self.on_create = on_create
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def get(self, utility):
+        instance = self._instances.get(utility)
+        if instance is not None:
+            return instance
+
+        if utility not in UTILITIES:
+            return None
+
+        with self._lock:
+            instance = self._instances.get(utility)
+            if instance is None:
+                instance = self._build(utility)
+                self._instances[utility] = instance
+        return instance
+
+    def _build(self, utility):
+        module_path, class_name = self.class_path.format(
+            utility=utility,
+            Utility=utility.title()
+        ).rsplit(".", 1)
+
+        module = importlib.import_module(module_path, self.package)
+        instance = getattr(module, class_name)()
+
+        if self.on_create is not None:
+            self.on_create(instance)
+        return instance
+
+    def loaded(self):
+        return list(self._instances)
+
+
+# Shared by the API routes and the scraper's model creation
+utility_apis = UtilityRegistry(
+    ".{utility}.{Utility}API.{Utility}API",
+    package=__package__,
+    on_create=lambda api: api.warm()
+)
@@ -0,0 +1,18 @@
+import os
+
+# Where UtilityAPI's queries run, "bigquery" or "local" for DuckDB over files in LOCAL_DATA_DIR
+QUERY_BACKEND = os.environ.get("QUERY_BACKEND", "bigquery")
+LOCAL_DATA_DIR = os.environ.get("LOCAL_DATA_DIR", "local_data")
+
+
+def select_executor(backend):
+    if backend == "bigquery":
+        from .BigQueryExecutor import executor
+        return executor
+    if backend == "local":
+        from .LocalExecutor import LocalExecutor
+        return LocalExecutor(LOCAL_DATA_DIR)
+    raise ValueError("Unknown query backend " + backend)
+
+
+executor = select_executor(QUERY_BACKEND)
@@ -0,0 +1,37 @@
+def epoch_seconds(series):
+    import pandas as pd
+
+    return (pd.to_datetime(series, utc=True) - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+
+
+def timestamp_column(series, timestamps):
+    if timestamps == "iso":
+        return series.astype(str).tolist()
+
+    seconds = epoch_seconds(series)
+    if timestamps == "step" and len(seconds) > 0:
+        steps = seconds.diff().iloc[1:]
+        # Only a regular series can be described by where it starts and how far apart the values are
+        if len(steps) == 0 or (steps == steps.iloc[0]).all():
+            return {
+                "start": int(seconds.iloc[0]),
+                "step": int(steps.iloc[0]) if len(steps) > 0 else 0,
+                "count": len(seconds)
+            }
+    return seconds.tolist()
+
+
+def to_columns(df, timestamp_columns=(), timestamps="iso"):
+    """
+    One list per column instead of one dict per row, so each key is only sent once.
+
+    Timestamps can be ISO strings, epoch seconds, or with "step" a {start, step, count}
+    when the values are evenly spaced (falling back to epoch seconds when they aren't).
+    """
+    columns = {}
+    for column in df.columns:
+        if column in timestamp_columns:
+            columns[column] = timestamp_column(df[column], timestamps)
+        else:
+            columns[column] = df[column].tolist()
+    return columns
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+# The finest grain of a utility's intensity_cube, every breakdown is a rollup of these
+GRAIN = ("year", "month", "dayofweek", "hour")
+
+
+def aggregate(cube, by):
+    """
+    Total intensity_sum and hour_count for each combination of the `by` columns, sorted by them.
+    A cell with no intensity has a null sum and a count of 0, it adds nothing to either.
+    """
+    by = list(by)
+    if len(cube.index) == 0:
+        return pd.DataFrame({column: pd.Series(dtype="int64") for column in by + ["intensity_sum", "hour_count"]})
+
+    keys = np.column_stack([cube[column].to_numpy(dtype="int64") for column in by])
+    groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    df = pd.DataFrame(groups, columns=by)
+    df["intensity_sum"] = np.bincount(inverse, weights=np.nan_to_num(
+        cube["intensity_sum"].to_numpy(dtype="float64")), minlength=len(groups))
+    df["hour_count"] = np.bincount(inverse, weights=cube["hour_count"].to_numpy(
+        dtype="float64"), minlength=len(groups)).astype("int64")
+    return df
+
+
+def rollup(cube, by):
+    """
+    Average carbon intensity for each combination of the `by` columns, sorted by them.
+
+    Each group's average is the sum of its cells' intensity_sum over the sum of their hour_count,
+    which is exactly the AVG over the hours themselves, hours with no intensity are left out of both.
+    """
+    df = aggregate(cube, by)
+    sums = df.pop("intensity_sum").to_numpy(dtype="float64")
+    counts = df.pop("hour_count").to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        df["carbon_intensity"] = np.where(counts > 0, sums / counts, np.nan)
+    return df
@@ -0,0 +1,3 @@
+# How a response's rows and timestamps can be laid out, checked before anything heavy is imported
+LAYOUTS = ("records", "columnar")
+TIMESTAMP_FORMATS = ("iso", "epoch", "step")
@@ -1,4 +1,3 @@
-import requests
 from ..UtilityAPI import UtilityAPI
 
 config_tepco = {
@@ -16,45 +15,3 @@ config_tepco = {
 class TepcoAPI(UtilityAPI):
     def __init__(self):
         super().__init__("tepco", config_tepco)
-
-    def _pumped_storage_calc_query_string(self):
-        return """
-            SELECT *,
-            (daMWh_nuclear + daMWh_fossil + daMWh_hydro + daMWh_geothermal + daMWh_biomass + daMWh_solar_output + daMWh_wind_output + daMWh_pumped_storage_contribution + daMWh_interconnector_contribution) as daMWh_total_generation
-            FROM (
-                SELECT *,
-                if(daMWh_interconnectors > 0,daMWh_interconnectors, 0) as daMWh_interconnector_contribution,
-                if(daMWh_pumped_storage > 0,daMWh_pumped_storage, 0) as daMWh_pumped_storage_contribution,
-                FROM `japan-grid-carbon-api{bqStageName}.{utility}.historical_data_by_generation_type`
-            )
-        """.format(
-            bqStageName=self.bqStageName,
-            utility=self.utility
-        )
-
-    def _carbon_intensity_query_string(self):
-        ci = self.get_carbon_intensity_factors()
-
-        return """
-        (
-            (daMWh_nuclear * {intensity_nuclear}) +
-            (daMWh_fossil * {intensity_fossil}) +
-            (daMWh_hydro * {intensity_hydro}) +
-            (daMWh_geothermal * {intensity_geothermal}) +
-            (daMWh_biomass * {intensity_biomass}) +
-            (daMWh_solar_output * {intensity_solar_output}) +
-            (daMWh_wind_output * {intensity_wind_output}) +
-            (daMWh_pumped_storage_contribution * {intensity_pumped_storage}) +
-            (daMWh_interconnector_contribution * {intensity_interconnectors})
-        ) / daMWh_total_generation
-        """.format(
-            intensity_nuclear=ci["kWh_nuclear"],
-            intensity_fossil=ci["kWh_fossil"],
-            intensity_hydro=ci["kWh_hydro"],
-            intensity_geothermal=ci["kWh_geothermal"],
-            intensity_biomass=ci["kWh_biomass"],
-            intensity_solar_output=ci["kWh_solar_output"],
-            intensity_wind_output=ci["kWh_wind_output"],
-            intensity_pumped_storage=ci["kWh_pumped_storage"],
-            intensity_interconnectors=ci["kWh_interconnectors"]
-        )
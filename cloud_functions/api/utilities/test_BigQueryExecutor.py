@@ -0,0 +1,177 @@
+import pytest
+import threading
+import concurrent.futures
+import requests
+from .BigQueryExecutor import BigQueryExecutor
+
+
+class FakeRows:
+    def __init__(self, page_size, total_rows):
+        self.page_size = page_size
+        self.total_rows = total_rows
+
+    def to_dataframe(self, bqstorage_client=None, create_bqstorage_client=True):
+        if bqstorage_client is not None:
+            return "storage dataframe"
+        assert create_bqstorage_client is False
+        return "dataframe"
+
+
+class FakeJob:
+    def __init__(self, query, slow, total_rows):
+        self.query = query
+        self.slow = slow
+        self.total_rows = total_rows
+        self.cancelled = False
+
+    def result(self, timeout=None, page_size=None):
+        if self.slow and timeout is not None:
+            raise self.slow()
+        return FakeRows(page_size, self.total_rows)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeClient:
+    def __init__(self, slow=None, total_rows=10):
+        self.slow = slow
+        self.total_rows = total_rows
+        self.jobs = []
+
+    def query(self, query, job_config=None):
+        job = FakeJob(query, self.slow, self.total_rows)
+        self.jobs.append(job)
+        return job
+
+    def load_table_from_dataframe(self, df, table_id, job_config=None):
+        job = FakeJob(table_id, self.slow, len(df))
+        self.jobs.append(job)
+        return job
+
+
+def test_client_created_once():
+    created = []
+
+    def factory():
+        created.append(1)
+        return FakeClient()
+
+    executor = BigQueryExecutor(client_factory=factory)
+
+    threads = [threading.Thread(target=lambda: executor.read_dataframe("SELECT 1"))
+               for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(created) == 1
+    assert len(executor.client.jobs) == 8
+
+
+def test_query_and_latency(clock):
+    client = FakeClient()
+    clock.step = 0.25
+    executor = BigQueryExecutor(client_factory=lambda: client, clock=clock)
+
+    assert executor.read_dataframe(
+        "SELECT 1", label="daily_intensity") == "dataframe"
+    assert executor.query("SELECT 2", label="stream",
+                          page_size=100).page_size == 100
+    executor.execute("CREATE MODEL", label="daily_intensity")
+
+    stats = executor.stats()
+    assert stats["daily_intensity"]["count"] == 2
+    assert stats["daily_intensity"]["mean_ms"] == 250
+    assert stats["stream"]["count"] == 1
+    assert [job.query for job in client.jobs] == [
+        "SELECT 1", "SELECT 2", "CREATE MODEL"]
+
+
+@pytest.mark.parametrize("error", [concurrent.futures.TimeoutError, requests.exceptions.Timeout])
+def test_timeout_cancels_job(error):
+    client = FakeClient(slow=error)
+    executor = BigQueryExecutor(timeout=1, client_factory=lambda: client)
+
+    with pytest.raises(error):
+        executor.read_dataframe("SELECT 1", label="slow")
+
+    assert client.jobs[0].cancelled
+    assert executor.stats()["slow"]["count"] == 1
+
+
+def test_execute_is_not_timed_out():
+    client = FakeClient(slow=concurrent.futures.TimeoutError)
+    executor = BigQueryExecutor(timeout=1, client_factory=lambda: client)
+
+    executor.execute("CREATE MODEL", label="create_model")
+
+    assert not client.jobs[0].cancelled
+    assert executor.stats()["create_model"]["count"] == 1
+
+
+def test_storage_api_for_large_results():
+    client = FakeClient(total_rows=10000)
+    executor = BigQueryExecutor(
+        storage_min_rows=5000,
+        client_factory=lambda: client,
+        storage_client_factory=lambda: "storage client"
+    )
+
+    assert executor.read_dataframe(
+        "SELECT big", label="historic_intensity") == "storage dataframe"
+    assert "historic_intensity storage download" in executor.stats()
+
+    client.total_rows = 100
+    assert executor.read_dataframe("SELECT small") == "dataframe"
+
+
+def test_storage_api_not_installed():
+    created = []
+
+    def storage_client_factory():
+        created.append(1)
+        return None
+
+    executor = BigQueryExecutor(
+        storage_min_rows=1,
+        client_factory=lambda: FakeClient(total_rows=10000),
+        storage_client_factory=storage_client_factory
+    )
+
+    assert executor.read_dataframe("SELECT big") == "dataframe"
+    assert executor.read_dataframe("SELECT big") == "dataframe"
+    assert len(created) == 1
+
+
+def test_query_parameters():
+    import datetime
+    from google.cloud import bigquery
+    from .BigQueryExecutor import query_parameters
+
+    parameters = query_parameters({
+        "year": 2021,
+        "first_day": datetime.date(2020, 1, 1),
+        "days": [datetime.date(2020, 1, 1), datetime.date(2020, 1, 3)]
+    })
+
+    assert parameters == [
+        bigquery.ScalarQueryParameter("year", "INT64", 2021),
+        bigquery.ScalarQueryParameter(
+            "first_day", "DATE", datetime.date(2020, 1, 1)),
+        bigquery.ArrayQueryParameter(
+            "days", "DATE", [datetime.date(2020, 1, 1), datetime.date(2020, 1, 3)])
+    ]
+
+
+def test_load_dataframe():
+    client = FakeClient()
+    executor = BigQueryExecutor(client_factory=lambda: client)
+
+    executor.load_dataframe([1, 2, 3], "tepco.historical_data_by_generation_type",
+                            label="load historical_data_by_generation_type")
+
+    assert client.jobs[0].query == "tepco.historical_data_by_generation_type"
+    assert executor.stats()[
+        "load historical_data_by_generation_type"]["count"] == 1
@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import pandas as pd
+from .HourlyStore import HourlyStore, epoch_hours, hour_timestamps
+
+
+def test_epoch_hours_normalizes_timezones():
+    # Naive the same as UTC, as BigQuery loads them, kepco and tohokuden localize to Asia/Tokyo
+    naive = pd.Series(pd.to_datetime(['2020-01-01 09:00', '2020-01-01 10:00']))
+    utc = naive.dt.tz_localize('UTC')
+    tokyo = naive.dt.tz_localize('Asia/Tokyo')
+
+    assert epoch_hours(naive).tolist() == [438297, 438298]
+    assert epoch_hours(utc).tolist() == [438297, 438298]
+    assert epoch_hours(tokyo).tolist() == [438288, 438289]
+    assert hour_timestamps(np.array([438288])).tolist() == [
+        pd.Timestamp('2020-01-01 00:00', tz='UTC')]
+
+
+def test_slice_with_gaps(tmp_path):
+    store = HourlyStore.write(
+        str(tmp_path), [100, 101, 103, 120], [1.0, 2.0, 3.0, 4.0], "v1")
+
+    hours, values, valid = store.slice(99, 104)
+
+    assert hours.tolist() == [100, 101, 102, 103]
+    assert valid.tolist() == [True, True, False, True]
+    assert values[valid].tolist() == [1.0, 2.0, 3.0]
+    assert store.slice(119, 200)[0].tolist() == [119, 120]
+    assert store.slice(0, 50)[0].tolist() == []
+
+
+def test_reopened_store_is_mapped_not_read(tmp_path):
+    HourlyStore.write(str(tmp_path), np.arange(10), np.arange(10.0), "v1")
+
+    store = HourlyStore.open(str(tmp_path))
+
+    assert store.version == "v1"
+    assert isinstance(store.values, np.memmap)
+    assert store.slice(2, 5)[1].tolist() == [2.0, 3.0, 4.0]
+
+
+def test_rewriting_replaces_the_old_files(tmp_path):
+    HourlyStore.write(str(tmp_path), [1], [1.0], "v1")
+    old = HourlyStore.open(str(tmp_path))
+
+    HourlyStore.write(str(tmp_path), [1, 2], [5.0, 6.0], "v2")
+
+    assert HourlyStore.open(str(tmp_path)).slice(1, 3)[1].tolist() == [5.0, 6.0]
+    # meta.json, the lock, and both writes' values and validity
+    assert len(os.listdir(str(tmp_path))) == 6
+    # Already mapped files stay readable
+    assert old.slice(1, 2)[1].tolist() == [1.0]
+
+    HourlyStore.write(str(tmp_path), [1], [7.0], "v3")
+    assert len(os.listdir(str(tmp_path))) == 6
+
+
+def test_open_retries_when_the_files_are_replaced(tmp_path, mocker):
+    HourlyStore.write(str(tmp_path), [1], [1.0], "v1")
+    mocker.patch.object(HourlyStore, '__init__', side_effect=[
+        FileNotFoundError(), None])
+
+    assert HourlyStore.open(str(tmp_path)) is not None
+    assert HourlyStore.__init__.call_count == 2
+
+
+def test_empty_store(tmp_path):
+    store = HourlyStore.write(str(tmp_path), [], [], "v1")
+
+    assert HourlyStore.open(str(tmp_path)).hours == 0
+    assert store.slice(0, 10)[0].tolist() == []
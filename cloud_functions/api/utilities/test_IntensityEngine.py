@@ -0,0 +1,146 @@
+import pytest
+import numpy as np
+import pandas as pd
+from . import UtilityAPI as utility_api_module
+from . import LocalExecutor as local_executor_module
+from . import IntensityEngine as intensity_engine_module
+from .IntensityEngine import IntensityEngine
+from .UtilityAPI import UtilityAPI, GENERATION_COLUMNS
+from .UtilityRegistry import utility_apis
+from ..cache.shared import response_cache
+
+test_config = {
+    "pumped_storage_factor": 80.07,
+    "fuel_type_totals": {
+        "lng": 1,
+        "oil": 1,
+        "coal": 1
+    }
+}
+
+
+def generation(api, hours, start='2020-01-01', tz='UTC'):
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        'datetime': pd.date_range(start, periods=hours, freq='h', tz=tz)
+    })
+    for source in api.generation_sources:
+        df[api._column(GENERATION_COLUMNS[source][0])] = rng.integers(-50, 500, hours)
+    if api.guard_zero_generation:
+        # An hour with nothing recorded, BigQuery would refuse to divide by it for the other utilities
+        df.loc[5, [api._column(GENERATION_COLUMNS[source][0])
+                   for source in api.generation_sources]] = 0
+    return df
+
+
+@pytest.mark.skipif(not local_executor_module.available(), reason="duckdb not installed")
+@pytest.mark.parametrize("utility", ["tepco", "hepco", "okiden"])
+# Most scrapers write naive datetimes, both backends take them as UTC
+@pytest.mark.parametrize("tz", ["UTC", None])
+def test_engine_matches_the_sql(tmp_path, mocker, utility, tz):
+    api = utility_apis.get(utility)
+    (tmp_path / utility).mkdir()
+    df = generation(api, 24 * 40, tz=tz)
+    df.to_parquet(tmp_path / utility / 'historical_data_by_generation_type.parquet')
+    local = local_executor_module.LocalExecutor(str(tmp_path))
+    mocker.patch.object(utility_api_module, 'executor', local)
+    engine = IntensityEngine(api, store_dir=str(tmp_path / "store"))
+    days = ["2020-01-01", "2020-01-02", "2020-01-09", "2020-02-05"]
+
+    sql = local.read_dataframe(api._historic_intensity_query(days),
+                               params=api._date_parameters(days))
+    in_process = engine.historic_intensity(days)
+
+    assert in_process['timestamp'].tolist() == pd.to_datetime(
+        sql['timestamp'], utc=True).tolist()
+    np.testing.assert_allclose(in_process['carbon_intensity'].to_numpy(),
+                               sql['carbon_intensity'].to_numpy(dtype="float64"))
+
+    sql_cube = local.read_dataframe(api._intensity_cube_query_string())
+    in_process_cube = engine.cube()
+
+    for column in ["year", "month", "dayofweek", "hour", "hour_count"]:
+        assert in_process_cube[column].tolist() == sql_cube[column].tolist()
+    np.testing.assert_allclose(in_process_cube['intensity_sum'].to_numpy(),
+                               sql_cube['intensity_sum'].to_numpy(dtype="float64"))
+
+
+def test_engine_streams_the_same_rows_in_chunks(tmp_path, mocker):
+    api = UtilityAPI('tepco', test_config)
+    mocker.patch.object(api, '_read_generation', return_value=generation(api, 24 * 10))
+    mocker.patch.object(api, '_generation_version', return_value=1)
+    engine = IntensityEngine(api, store_dir=str(tmp_path))
+    days = ["2020-01-01", "2020-01-02", "2020-01-05", "2020-01-06", "2020-01-07"]
+
+    streamed = list(engine.stream_historic_intensity(days, chunk_hours=5))
+
+    assert pd.DataFrame(streamed).equals(engine.historic_intensity(days))
+
+
+def test_engine_reloads_only_when_the_table_changes(tmp_path, mocker, clock):
+    api = UtilityAPI('tepco', test_config)
+    read_generation = mocker.patch.object(
+        api, '_read_generation', return_value=generation(api, 48))
+    version = mocker.patch.object(api, '_generation_version', return_value=1)
+    engine = IntensityEngine(api, check_seconds=60,
+                             store_dir=str(tmp_path), clock=clock)
+
+    engine.historic_intensity(["2020-01-01"])
+    version.return_value = 2
+    engine.historic_intensity(["2020-01-01"])
+    assert read_generation.call_count == 1
+
+    clock.now = 61
+    engine.historic_intensity(["2020-01-01"])
+    clock.now = 200
+    engine.historic_intensity(["2020-01-01"])
+    assert read_generation.call_count == 2
+    assert version.call_count == 3
+
+
+def test_engine_keeps_its_copy_when_the_check_fails(tmp_path, mocker, clock):
+    api = UtilityAPI('tepco', test_config)
+    mocker.patch.object(api, '_read_generation', return_value=generation(api, 48))
+    version = mocker.patch.object(api, '_generation_version', return_value=1)
+    engine = IntensityEngine(api, check_seconds=60,
+                             store_dir=str(tmp_path), clock=clock)
+    engine.historic_intensity(["2020-01-01"])
+
+    version.side_effect = RuntimeError("BigQuery is down")
+    clock.now = 61
+
+    assert len(engine.historic_intensity(["2020-01-02"]).index) == 24
+
+
+def test_in_process_utilities_skip_the_query(tmp_path, mocker):
+    mocker.patch.object(utility_api_module, 'IN_PROCESS_UTILITIES', ['tepco'])
+    mocker.patch.object(intensity_engine_module,
+                        'IN_PROCESS_STORE_DIR', str(tmp_path))
+    read_dataframe = mocker.patch(
+        'cloud_functions.api.utilities.BigQueryExecutor.executor.read_dataframe')
+    api = UtilityAPI('tepco', test_config)
+    mocker.patch.object(api, '_read_generation', return_value=generation(api, 72))
+    mocker.patch.object(api, '_generation_version', return_value=1)
+    response_cache.clear('tepco')
+
+    historic = api.historic_intensity_frame("2020-01-02", "2020-01-02")
+    daily = api.daily_intensity()
+    streamed = list(api.stream_historic_intensity("2020-01-03", "2020-01-03"))
+
+    read_dataframe.assert_not_called()
+    assert len(historic.index) == 24
+    assert len(daily["carbon_intensity_average"]["data"]) == 24
+    assert streamed[0]["timestamp"] == "2020-01-03 00:00:00+00:00"
+
+
+def test_engine_maps_a_store_another_process_wrote(tmp_path, mocker):
+    api = UtilityAPI('tepco', test_config)
+    read_generation = mocker.patch.object(
+        api, '_read_generation', return_value=generation(api, 48))
+    mocker.patch.object(api, '_generation_version', return_value=1)
+
+    first = IntensityEngine(api, store_dir=str(tmp_path)).historic_intensity(["2020-01-02"])
+    second = IntensityEngine(api, store_dir=str(tmp_path)).historic_intensity(["2020-01-02"])
+
+    assert read_generation.call_count == 1
+    pd.testing.assert_frame_equal(first, second)
@@ -0,0 +1,79 @@
+import pytest
+import numpy as np
+import pandas as pd
+from . import UtilityAPI as utility_api_module
+from . import LocalExecutor as local_executor_module
+from .LocalExecutor import LocalExecutor, translate
+from .QueryBackend import UnsupportedQuery
+from .UtilityAPI import GENERATION_COLUMNS
+from .UtilityRegistry import utility_apis
+from ..cache.shared import response_cache
+
+requires_duckdb = pytest.mark.skipif(
+    not local_executor_module.available(), reason="duckdb not installed")
+
+
+def test_translate_rewrites_bigquery_functions():
+    query, tables = translate("""
+        SELECT EXTRACT(DAYOFWEEK FROM datetime) AS dayofweek
+        FROM `japan-grid-carbon-api-staging.tepco.historical_data_by_generation_type`
+        WHERE datetime >= TIMESTAMP(@first_day)
+        AND EXTRACT(DATE from datetime) IN UNNEST(@days)
+    """)
+
+    assert tables == {("tepco", "historical_data_by_generation_type")}
+    assert "(EXTRACT(DOW FROM datetime) + 1) AS dayofweek" in query
+    assert "FROM tepco__historical_data_by_generation_type" in query
+    assert "bq_timestamp($first_day)" in query
+    assert "CAST(datetime AS DATE) IN (SELECT UNNEST($days))" in query
+
+
+def test_translate_refuses_models():
+    with pytest.raises(UnsupportedQuery):
+        translate("SELECT * FROM ML.FORECAST(MODEL `japan-grid-carbon-api.tepco.model`)")
+
+
+def write_hours(tmp_path, api, hours):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'datetime': pd.date_range('2020-01-01', periods=hours, freq='h')
+    })
+    for source in api.generation_sources:
+        df[api._column(GENERATION_COLUMNS[source][0])] = rng.integers(-50, 500, hours)
+    (tmp_path / api.utility).mkdir()
+    df.to_csv(tmp_path / api.utility /
+              'historical_data_by_generation_type.csv', index=False)
+    return df
+
+
+@requires_duckdb
+def test_local_backend_matches_the_pandas_calculation(tmp_path, mocker):
+    api = utility_apis.get('tepco')
+    hours = write_hours(tmp_path, api, 24 * 10)
+    mocker.patch.object(utility_api_module, 'executor', LocalExecutor(str(tmp_path)))
+    response_cache.clear('tepco')
+
+    expected = api.calculate_carbon_intensity(hours)
+    historic = api._query_historic_intensity(["2020-01-02", "2020-01-03", "2020-01-05"])
+    streamed = list(api.stream_historic_intensity("2020-01-02", "2020-01-03"))
+    daily = api._average_intensity("hour")
+
+    days = expected['datetime'].dt.strftime('%Y-%m-%d')
+    wanted = expected[days.isin(["2020-01-02", "2020-01-03", "2020-01-05"])]
+    assert historic['carbon_intensity'].tolist() == pytest.approx(
+        wanted['carbon_intensity'].tolist())
+    assert len(streamed) == 48
+    assert streamed[0]['carbon_intensity'] == pytest.approx(
+        wanted['carbon_intensity'].iloc[0])
+    hourly = expected.groupby(expected['datetime'].dt.hour)['carbon_intensity'].mean()
+    assert daily['carbon_intensity'].tolist() == pytest.approx(hourly.tolist())
+
+
+@requires_duckdb
+def test_local_backend_records_latency(tmp_path):
+    executor = LocalExecutor(str(tmp_path))
+
+    executor.read_dataframe("SELECT 1 as one", label="one")
+
+    assert executor.stats()["one"]["count"] == 1
+    assert executor.table_labels("japan-grid-carbon-api.tepco.anything") == {}
@@ -0,0 +1,15 @@
+import pytest
+from .QueryBackend import QueryBackend
+
+
+class ReadOnlyBackend(QueryBackend):
+    def query(self, query, label="query", page_size=None, params=None):
+        return []
+
+    def read_dataframe(self, query, label="query", params=None):
+        return None
+
+
+def test_backend_must_implement_the_interface():
+    with pytest.raises(TypeError):
+        ReadOnlyBackend()
@@ -4,7 +4,13 @@ import requests_mock
 import json
 import gc
 import pandas as pd
-from .UtilityAPI import UtilityAPI
+import datetime
+import re
+from . import UtilityAPI as utility_api_module
+from .UtilityAPI import UtilityAPI, GENERATION_COLUMNS
+from .UtilityRegistry import UTILITIES, utility_apis
+from ..cache.shared import response_cache
+from ..cache.Freshness import FORECAST_MIN_TTL
 
 test_config = {
     "pumped_storage_factor": 80.07,
@@ -39,9 +45,7 @@ def test_get_carbon_intensity_factors():
 def test_gbq_query_string():
     api = UtilityAPI('tepco', test_config)
 
-    expected = """
-        AVG(
-            
+    expected_intensity_calc = """
         (
             (daMWh_nuclear * 19) +
             (daMWh_fossil * 718.3333333333334) +
@@ -53,36 +57,105 @@ def test_gbq_query_string():
             (daMWh_pumped_storage_contribution * 80.07) +
             (daMWh_interconnector_contribution * 500)
         ) / daMWh_total_generation
-        
-        ) as carbon_intensity
-        FROM (
-            
+        """
+    expected_from_string = """
             SELECT *,
             (daMWh_nuclear + daMWh_fossil + daMWh_hydro + daMWh_geothermal + daMWh_biomass + daMWh_solar_output + daMWh_wind_output + daMWh_pumped_storage_contribution + daMWh_interconnector_contribution) as daMWh_total_generation
             FROM (
-                SELECT *,
-                if(daMWh_interconnectors > 0,daMWh_interconnectors, 0) as daMWh_interconnector_contribution,
-                if(daMWh_pumped_storage > 0,daMWh_pumped_storage, 0) as daMWh_pumped_storage_contribution,
+                SELECT
+                datetime,
+                daMWh_nuclear,
+                daMWh_fossil,
+                daMWh_hydro,
+                daMWh_geothermal,
+                daMWh_biomass,
+                daMWh_solar_output,
+                daMWh_wind_output,
+                if(daMWh_pumped_storage > 0, daMWh_pumped_storage, 0) as daMWh_pumped_storage_contribution,
+                if(daMWh_interconnectors > 0, daMWh_interconnectors, 0) as daMWh_interconnector_contribution
                 FROM `japan-grid-carbon-api-staging.tepco.historical_data_by_generation_type`
             )
-        
-        )
         """
 
-    assert expected == api._get_intensity_query_string()
+    assert expected_intensity_calc == api._intensity_calc()
+    assert expected_from_string == api._from_string()
+
+
+def projected_columns(query):
+    # Columns read from historical_data_by_generation_type by the SELECTs directly over it
+    projections = re.findall(
+        r"SELECT\s+((?:(?!SELECT).)*?)\s*FROM\s+`?japan-grid-carbon-api[\w-]*\.\w+\.historical_data_by_generation_type",
+        query, re.S)
+    columns = []
+    for projection in projections:
+        # Split on the commas that aren't inside brackets
+        depth = 0
+        expression = ""
+        for character in projection + ",":
+            if character == "," and depth == 0:
+                if expression.strip() != "":
+                    columns.append(
+                        re.split(r"\s+as\s+", expression.strip(), flags=re.I)[0])
+                expression = ""
+                continue
+            depth += {"(": 1, ")": -1}.get(character, 0)
+            expression += character
+    return projections, columns
+
+
+def test_every_endpoint_only_reads_the_columns_it_needs(mocker):
+    read_dataframe = mocker.patch(
+        'cloud_functions.api.utilities.BigQueryExecutor.executor.read_dataframe')
+    days = ["2020-01-01", "2020-01-03"]
+
+    for utility in UTILITIES:
+        api = utility_apis.get(utility)
+        generation = [api._column(GENERATION_COLUMNS[source][0])
+                      for source in api.generation_sources]
+        expected = {"datetime"} | set(generation)
+
+        read_dataframe.reset_mock()
+        api._query_historic_intensity(days)
+        api._query_historic_intensity(days[:1])
+        api._extract_prediction_from_big_query_by_weekday_month_and_year(2021)
+
+        queries = [call[0][0] for call in read_dataframe.call_args_list] + \
+            [api._historic_intensity_query(days), api._from_string(),
+             api._intensity_cube_query_string()]
+        for query in queries:
+            projections, columns = projected_columns(query)
+            assert len(projections) == 1, query
+            assert "*" not in columns
+            if "ML.PREDICT" in query:
+                # The prediction only needs the timestamps
+                assert columns == ["@year",
+                                   "EXTRACT(DAYOFWEEK FROM datetime)",
+                                   "EXTRACT(MONTH FROM datetime)",
+                                   "EXTRACT(HOUR FROM datetime)"]
+                continue
+            read = {re.sub(r"if\((\w+) > 0.*", r"\1", column)
+                    for column in columns}
+            assert read == expected, utility
+        assert api._table_columns() == ["datetime"] + generation
+
+
+def mock_intensity_cube(mocker, api, d):
+    response_cache.clear(api.utility)
+    mocker.patch.object(api, '_query_intensity_cube',
+                        return_value=pd.DataFrame(data=d))
 
 
 def test_daily_intensity(mocker):
     api = UtilityAPI('tepco', test_config)
 
-    def mock_daily_intensity(self):
-        d = {'hour': [1, 2], 'carbon_intensity': [500, 550]}
-        return pd.DataFrame(data=d)
-
-    mocker.patch(
-        'pandas.read_gbq',
-        mock_daily_intensity
-    )
+    mock_intensity_cube(mocker, api, {
+        'year': [2016, 2016, 2017],
+        'month': [1, 1, 2],
+        'dayofweek': [1, 1, 3],
+        'hour': [1, 2, 1],
+        'intensity_sum': [400, 550, 1100],
+        'hour_count': [1, 1, 2]
+    })
 
     expected = {
         "carbon_intensity_average": {
@@ -106,18 +179,14 @@ def test_daily_intensity(mocker):
 def test_daily_intensity_by_month(mocker):
     api = UtilityAPI('tepco', test_config)
 
-    def mock_daily_intensity_by_month(self):
-        d = {
-            'hour': [1, 2, 1, 2],
-            'carbon_intensity': [500, 550, 600, 650],
-            'month': [1, 1, 2, 2]
-        }
-        return pd.DataFrame(data=d)
-
-    mocker.patch(
-        'pandas.read_gbq',
-        mock_daily_intensity_by_month
-    )
+    mock_intensity_cube(mocker, api, {
+        'year': [2016, 2016, 2016, 2017, 2016],
+        'month': [1, 1, 2, 2, 2],
+        'dayofweek': [1, 1, 1, 1, 1],
+        'hour': [1, 2, 1, 1, 2],
+        'intensity_sum': [500, 550, 500, 1300, 650],
+        'hour_count': [1, 1, 1, 2, 1]
+    })
 
     expected = {
         "carbon_intensity_average": {
@@ -159,19 +228,14 @@ def test_daily_intensity_by_month(mocker):
 def test_daily_intensity_by_month_and_weekday(mocker):
     api = UtilityAPI('tepco', test_config)
 
-    def mock_daily_intensity_by_month_and_weekday(self):
-        d = {
-            'hour': [1, 2, 3, 4],
-            'carbon_intensity': [500, 550, 600, 650],
-            'month': [1, 1, 2, 2],
-            'dayofweek': [1, 2, 1, 2]
-        }
-        return pd.DataFrame(data=d)
-
-    mocker.patch(
-        'pandas.read_gbq',
-        mock_daily_intensity_by_month_and_weekday
-    )
+    mock_intensity_cube(mocker, api, {
+        'year': [2016, 2017, 2016, 2016, 2016],
+        'month': [1, 1, 1, 2, 2],
+        'dayofweek': [1, 1, 2, 1, 2],
+        'hour': [1, 1, 2, 3, 4],
+        'intensity_sum': [400, 1100, 550, 600, 650],
+        'hour_count': [1, 2, 1, 1, 1]
+    })
 
     expected = {
         "carbon_intensity_by_month_and_weekday": {
@@ -212,20 +276,14 @@ def test_daily_intensity_by_month_and_weekday(mocker):
 def test_daily_intensity_by_year_month_and_weekday(mocker):
     api = UtilityAPI('tepco', test_config)
 
-    def test_daily_intensity_by_year_month_and_weekday(self):
-        d = {
-            'hour': [1, 2, 3, 4],
-            'year': [2016, 2016, 2017, 2017],
-            'carbon_intensity': [500, 550, 600, 650],
-            'month': [1, 1, 2, 2],
-            'dayofweek': [1, 2, 1, 2]
-        }
-        return pd.DataFrame(data=d)
-
-    mocker.patch(
-        'pandas.read_gbq',
-        test_daily_intensity_by_year_month_and_weekday
-    )
+    mock_intensity_cube(mocker, api, {
+        'hour': [1, 2, 3, 4],
+        'year': [2016, 2016, 2017, 2017],
+        'intensity_sum': [1000, 550, 600, 650],
+        'hour_count': [2, 1, 1, 1],
+        'month': [1, 1, 2, 2],
+        'dayofweek': [1, 2, 1, 2]
+    })
 
     expected = {
         "carbon_intensity_by_year_month_and_weekday": {
@@ -270,7 +328,7 @@ def test_daily_intensity_by_year_month_and_weekday(mocker):
 def test_daily_intensity_prediction_for_year_by_month_and_weekday(mocker):
     api = UtilityAPI('tepco', test_config)
 
-    def mock_daily_intensity_prediction_for_year_by_month_and_weekday(self):
+    def mock_daily_intensity_prediction_for_year_by_month_and_weekday(query, label=None, params=None):
         d = {
             'hour': [1, 2, 3, 4],
             'predicted_carbon_intensity': [500, 550, 600, 650],
@@ -281,7 +339,7 @@ def test_daily_intensity_prediction_for_year_by_month_and_weekday(mocker):
         return pd.DataFrame(data=d)
 
     mocker.patch(
-        'pandas.read_gbq',
+        'cloud_functions.api.utilities.BigQueryExecutor.executor.read_dataframe',
         mock_daily_intensity_prediction_for_year_by_month_and_weekday
     )
 
@@ -326,18 +384,14 @@ def test_daily_intensity_prediction_for_year_by_month_and_weekday(mocker):
 def test_daily_intensity_by_year(mocker):
     api = UtilityAPI('tepco', test_config)
 
-    def test_daily_intensity_by_year(self):
-        d = {
-            'hour': [1, 2, 3, 4],
-            'year': [2016, 2016, 2017, 2017],
-            'carbon_intensity': [500, 550, 600, 650],
-        }
-        return pd.DataFrame(data=d)
-
-    mocker.patch(
-        'pandas.read_gbq',
-        test_daily_intensity_by_year
-    )
+    mock_intensity_cube(mocker, api, {
+        'hour': [1, 2, 3, 4, 4],
+        'year': [2016, 2016, 2017, 2017, 2017],
+        'month': [1, 1, 1, 1, 7],
+        'dayofweek': [1, 1, 1, 1, 5],
+        'intensity_sum': [500, 550, 600, 700, 600],
+        'hour_count': [1, 1, 1, 1, 1]
+    })
 
     expected = {
         "carbon_intensity_average": {
@@ -381,7 +435,7 @@ def test_daily_intensity_by_year(mocker):
 def test_historic_data(mocker):
     api = UtilityAPI('tepco', test_config)
 
-    def test_historic_data(self):
+    def test_historic_data(query, label=None, params=None):
         d = {
             'timestamp': [
                 "2020-11-01 00:00:00+00:00",
@@ -394,7 +448,7 @@ def test_historic_data(mocker):
         return pd.DataFrame(data=d)
 
     mocker.patch(
-        'pandas.read_gbq',
+        'cloud_functions.api.utilities.BigQueryExecutor.executor.read_dataframe',
         test_historic_data
     )
 
@@ -420,3 +474,231 @@ def test_historic_data(mocker):
     }
 
     assert expected == api.historic_intensity('2020-11-01', '2020-11-02')
+
+
+def test_historic_data_columnar(mocker):
+    api = UtilityAPI('tepco', test_config)
+    # Days cached by the other tests would be used instead of the mock
+    response_cache.clear('tepco')
+
+    def test_historic_data(query, label=None, params=None):
+        d = {
+            'timestamp': [
+                "2020-11-01 00:00:00+00:00",
+                "2020-11-01 01:00:00+00:00",
+                "2020-11-01 02:00:00+00:00"
+            ],
+            'carbon_intensity': [500, 550, 600],
+        }
+        return pd.DataFrame(data=d)
+
+    mocker.patch(
+        'cloud_functions.api.utilities.BigQueryExecutor.executor.read_dataframe',
+        test_historic_data
+    )
+
+    iso = api.historic_intensity("2020-11-01", "2020-11-01", "columnar")
+    step = api.historic_intensity(
+        "2020-11-01", "2020-11-01", "columnar", "step")
+
+    assert iso == {
+        "historic": {
+            "timestamp": [
+                "2020-11-01 00:00:00+00:00",
+                "2020-11-01 01:00:00+00:00",
+                "2020-11-01 02:00:00+00:00"
+            ],
+            "carbon_intensity": [500, 550, 600]
+        }
+    }
+    assert step == {
+        "historic": {
+            "timestamp": {"start": 1604188800, "step": 3600, "count": 3},
+            "carbon_intensity": [500, 550, 600]
+        }
+    }
+
+
+def test_stream_historic_intensity(mocker):
+    api = UtilityAPI('tepco', test_config)
+    utc = datetime.timezone.utc
+
+    def rows():
+        for hour in range(3):
+            yield {
+                "timestamp": datetime.datetime(2020, 11, 1, hour, tzinfo=utc),
+                "carbon_intensity": 500 + hour
+            }
+
+    stream_query = mocker.patch.object(
+        UtilityAPI, '_stream_query', return_value=rows())
+
+    stream = api.stream_historic_intensity("2020-11-01", "2020-11-01")
+
+    # Nothing is queried until the first row is asked for
+    assert not stream_query.called
+    assert next(stream) == {
+        "timestamp": "2020-11-01 00:00:00+00:00",
+        "carbon_intensity": 500
+    }
+    assert len(list(stream)) == 2
+    assert stream_query.call_args[0][1] == {
+        "first_day": datetime.date(2020, 11, 1),
+        "last_day": datetime.date(2020, 11, 1)
+    }
+
+
+def test_date_filter_string():
+    api = UtilityAPI('tepco', test_config)
+
+    assert api._date_filter_string("datetime") == \
+        'datetime >= TIMESTAMP(@first_day) AND datetime < TIMESTAMP(DATE_ADD(@last_day, INTERVAL 1 DAY))'
+
+    assert api._date_filter_string("datetime", gaps=True) == \
+        'datetime >= TIMESTAMP(@first_day) AND datetime < TIMESTAMP(DATE_ADD(@last_day, INTERVAL 1 DAY))' + \
+        ' AND EXTRACT(DATE from datetime) IN UNNEST(@days)'
+
+
+def test_date_parameters():
+    api = UtilityAPI('tepco', test_config)
+
+    assert api._date_parameters(["2020-01-01", "2020-01-02"]) == {
+        "first_day": datetime.date(2020, 1, 1),
+        "last_day": datetime.date(2020, 1, 2)
+    }
+    assert api._date_parameters(["2020-01-01", "2020-01-03"])["days"] == [
+        datetime.date(2020, 1, 1),
+        datetime.date(2020, 1, 3)
+    ]
+
+
+def test_query_text_is_the_same_for_every_date_range(mocker):
+    api = UtilityAPI('tepco', test_config)
+    read_dataframe = mocker.patch(
+        'cloud_functions.api.utilities.BigQueryExecutor.executor.read_dataframe',
+        return_value=pd.DataFrame({'timestamp': [], 'carbon_intensity': []})
+    )
+
+    api._query_historic_intensity(["2020-01-01", "2020-01-02"])
+    api._query_historic_intensity(["2021-06-01"])
+
+    first, second = read_dataframe.call_args_list
+    assert first[0][0] is second[0][0]
+    assert first[1]["params"]["first_day"] == datetime.date(2020, 1, 1)
+    assert second[1]["params"]["last_day"] == datetime.date(2021, 6, 1)
+
+
+def test_calculate_carbon_intensity():
+    api = UtilityAPI('tepco', test_config)
+    ci = api.get_carbon_intensity_factors()
+    row = {api._column(GENERATION_COLUMNS[source][0]): 0 for source in api.generation_sources}
+    row.update({
+        'daMWh_nuclear': 10,
+        'daMWh_fossil': 20,
+        'daMWh_pumped_storage': -5,
+        'daMWh_interconnectors': 10
+    })
+    empty = dict(row, daMWh_nuclear=0, daMWh_fossil=0, daMWh_interconnectors=0)
+    df = pd.DataFrame([row, empty])
+    df['datetime'] = pd.to_datetime(['2020-01-01 00:00', '2020-01-01 01:00'])
+
+    result = api.calculate_carbon_intensity(df)
+
+    # Pumped storage that's charging isn't counted as generation
+    expected = (10 * ci['kWh_nuclear'] + 20 * ci['kWh_fossil'] +
+                10 * ci['kWh_interconnectors']) / 40
+    assert result['total_generation'].tolist()[0] == 40
+    assert result['carbon_intensity'].iloc[0] == pytest.approx(expected)
+    assert pd.isna(result['carbon_intensity'].iloc[1])
+
+
+def test_calculate_carbon_intensity_zero_generation_guard():
+    api = utility_apis.get('hepco')
+    df = pd.DataFrame({column: [0] for column in api._table_columns()})
+
+    result = api.calculate_carbon_intensity(df)
+
+    assert result['carbon_intensity'].tolist() == [0]
+
+
+def test_factor_version_changes_with_the_factors():
+    api = UtilityAPI('tepco', test_config)
+    same = UtilityAPI('tepco', test_config)
+    changed = UtilityAPI('tepco', dict(test_config, pumped_storage_factor=90))
+
+    assert api.factor_version() == same.factor_version()
+    assert api.factor_version() != changed.factor_version()
+
+
+def test_materialized_intensity_is_read_when_the_factors_match(mocker):
+    mocker.patch.object(utility_api_module, 'MATERIALIZED_INTENSITY', True)
+    api = UtilityAPI('tepco', test_config)
+    mocker.patch.object(api, '_stored_factor_version',
+                        return_value=api.factor_version())
+
+    query = api._historic_intensity_query(["2020-01-01"])
+
+    assert 'carbon_intensity\n        as carbon_intensity' in query
+    assert 'daMWh_nuclear' not in query
+
+
+def test_materialized_intensity_is_not_read_with_old_factors(mocker):
+    mocker.patch.object(utility_api_module, 'MATERIALIZED_INTENSITY', True)
+    api = UtilityAPI('tepco', test_config)
+    mocker.patch.object(api, '_stored_factor_version', return_value='old')
+
+    query = api._historic_intensity_query(["2020-01-01"])
+
+    assert 'daMWh_nuclear * 19' in query
+
+
+def test_breakdowns_share_one_intensity_cube(mocker):
+    api = UtilityAPI('tepco', test_config)
+    mock_intensity_cube(mocker, api, {
+        'year': [2016], 'month': [1], 'dayofweek': [1], 'hour': [1],
+        'intensity_sum': [500], 'hour_count': [1]
+    })
+
+    api.daily_intensity()
+    api.daily_intensity_by_month()
+    api.daily_intensity_by_month_and_year()
+
+    assert api._query_intensity_cube.call_count == 1
+
+
+def test_intensity_cube_is_read_from_its_table_when_current(mocker):
+    api = UtilityAPI('tepco', test_config)
+    read_dataframe = mocker.patch(
+        'cloud_functions.api.utilities.BigQueryExecutor.executor.read_dataframe')
+    stored = mocker.patch.object(api, '_stored_factor_version',
+                                 return_value=api.factor_version())
+    versions = {"intensity_cube": 2, "historical_data_by_generation_type": 1}
+    mocker.patch('cloud_functions.api.utilities.BigQueryExecutor.executor.table_version',
+                 side_effect=lambda table_id: versions[table_id.split(".")[-1]])
+
+    api._query_intensity_cube()
+    stored.return_value = 'old'
+    api._query_intensity_cube()
+    # New hours loaded since the cube was built
+    stored.return_value = api.factor_version()
+    versions["historical_data_by_generation_type"] = 3
+    api._query_intensity_cube()
+
+    labels = [call[1]["label"] for call in read_dataframe.call_args_list]
+    assert labels == ["intensity_cube", "intensity_cube_from_hours",
+                      "intensity_cube_from_hours"]
+    assert "intensity_cube" in read_dataframe.call_args_list[0][0][0]
+    assert "daMWh_nuclear" in read_dataframe.call_args_list[1][0][0]
+
+
+def test_prediction_ttl_follows_the_forecast_served(mocker):
+    api = UtilityAPI('tepco', test_config)
+    frame = mocker.patch.object(api, 'timeseries_prediction_frame', return_value=pd.DataFrame({
+        'forecast_timestamp': pd.to_datetime(['2020-01-02 00:00:00'], utc=True),
+        'date_created': [pd.Timestamp.utcnow() - pd.Timedelta(hours=1)]
+    }))
+
+    assert 22 * 60 * 60 < api.prediction_ttl("2020-01-02", "2020-01-02") <= 23 * 60 * 60
+
+    frame.return_value = frame.return_value.iloc[0:0]
+    assert api.prediction_ttl("2020-01-02", "2020-01-02") == FORECAST_MIN_TTL
@@ -0,0 +1,46 @@
+from . import UtilityAPI as utility_api_module
+from .UtilityRegistry import UtilityRegistry, UTILITIES, utility_apis
+from .tepco.TepcoAPI import TepcoAPI
+
+
+def test_unknown_utility():
+    assert utility_apis.get("fish") is None
+
+
+def test_built_once_and_reused():
+    created = []
+    registry = UtilityRegistry(
+        ".{utility}.{Utility}API.{Utility}API",
+        package=__package__,
+        on_create=created.append
+    )
+
+    first = registry.get("tepco")
+    second = registry.get("tepco")
+
+    assert isinstance(first, TepcoAPI)
+    assert first is second
+    assert created == [first]
+    assert registry.loaded() == ["tepco"]
+
+
+def test_every_utility_resolves():
+    for utility in UTILITIES:
+        api = utility_apis.get(utility)
+        assert api.utility == utility
+
+
+def test_warm_up_is_local(mocker):
+    mocker.patch.object(utility_api_module, 'MATERIALIZED_INTENSITY', True)
+    table_labels = mocker.patch(
+        'cloud_functions.api.utilities.BigQueryExecutor.executor.table_labels')
+    registry = UtilityRegistry(
+        ".{utility}.{Utility}API.{Utility}API",
+        package=__package__,
+        on_create=lambda api: api.warm()
+    )
+
+    api = registry.get("kepco")
+
+    assert api._carbon_intensity_factors is not None
+    table_labels.assert_not_called()
@@ -0,0 +1,42 @@
+import pandas as pd
+from .columnar import to_columns
+
+timestamps = [
+    "2020-11-01 00:00:00+00:00",
+    "2020-11-01 01:00:00+00:00",
+    "2020-11-01 03:00:00+00:00"
+]
+
+
+def test_to_columns():
+    df = pd.DataFrame({'hour': [0, 1], 'carbon_intensity': [500.5, 550]})
+
+    assert to_columns(df) == {
+        "hour": [0, 1],
+        "carbon_intensity": [500.5, 550]
+    }
+
+
+def test_epoch_timestamps():
+    df = pd.DataFrame({'timestamp': timestamps})
+
+    assert to_columns(df, ('timestamp',), "epoch") == {
+        "timestamp": [1604188800, 1604192400, 1604199600]
+    }
+
+
+def test_step_timestamps():
+    regular = pd.DataFrame({'timestamp': pd.to_datetime(timestamps[:2])})
+    single = pd.DataFrame({'timestamp': timestamps[:1]})
+    irregular = pd.DataFrame({'timestamp': timestamps})
+
+    assert to_columns(regular, ('timestamp',), "step") == {
+        "timestamp": {"start": 1604188800, "step": 3600, "count": 2}
+    }
+    assert to_columns(single, ('timestamp',), "step") == {
+        "timestamp": {"start": 1604188800, "step": 0, "count": 1}
+    }
+    # Gaps can't be described with a step, so these fall back to epoch seconds
+    assert to_columns(irregular, ('timestamp',), "step") == {
+        "timestamp": [1604188800, 1604192400, 1604199600]
+    }
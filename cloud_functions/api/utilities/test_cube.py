@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from .cube import GRAIN, rollup
+
+
+def test_rollup_is_the_average_of_the_hours():
+    hours = pd.DataFrame({
+        'year': [2020, 2020, 2020, 2021, 2021],
+        'month': [1, 1, 2, 1, 1],
+        'dayofweek': [1, 2, 1, 1, 1],
+        'hour': [0, 0, 0, 0, 1],
+        'carbon_intensity': [400.0, 500.0, 600.0, 700.0, np.nan]
+    })
+    cube = hours.groupby(list(GRAIN)).agg(
+        intensity_sum=('carbon_intensity', 'sum'),
+        hour_count=('carbon_intensity', 'count')
+    ).reset_index()
+    cube.loc[cube['hour_count'] == 0, 'intensity_sum'] = np.nan
+
+    for by in [("hour",), ("year", "hour"), ("month", "dayofweek", "hour"), GRAIN]:
+        expected = hours.groupby(list(by))['carbon_intensity'].mean().reset_index()
+        pd.testing.assert_frame_equal(
+            rollup(cube, by), expected, check_dtype=False)
+
+
+def test_rollup_of_an_empty_cube():
+    cube = pd.DataFrame({column: [] for column in GRAIN + ('intensity_sum', 'hour_count')})
+
+    assert list(rollup(cube, ("hour",)).columns) == ["hour", "carbon_intensity"]
@@ -0,0 +1,64 @@
+# Per-request overhead of getting from the functions framework request into a Flask view
+#   run from cloud_functions/ with: python -m benchmarks.bench_dispatch
+import timeit
+import werkzeug.datastructures
+from flask import Flask, Request
+from werkzeug.test import EnvironBuilder
+
+from api.dispatch import dispatch
+
+app = Flask(__name__)
+
+
+@app.route('/v1/carbon_intensity/average/<utility>')
+def view(utility):
+    return b'{"data": {}, "fromCache": true}', 200, {'content-type': 'application/json'}
+
+
+def test_context_dispatch(request):
+    # The adapter api() and scrapers() used before
+    with app.app_context():
+        headers = werkzeug.datastructures.Headers()
+        for key, value in request.headers.items():
+            headers.add(key, value)
+        with app.test_request_context(method=request.method, base_url=request.base_url, path=request.path, query_string=request.query_string, headers=headers, data=request.data):
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = app.dispatch_request()
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            response = app.make_response(rv)
+            return app.process_response(response)
+
+
+def incoming_request():
+    # Roughly what arrives through the ESP proxy
+    return EnvironBuilder(
+        path='/v1/carbon_intensity/average/tepco',
+        base_url='https://us-central1-japan-grid-carbon-api.cloudfunctions.net/api',
+        headers={
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'User-Agent': 'Mozilla/5.0',
+            'X-Forwarded-For': '203.0.113.1',
+            'X-Forwarded-Proto': 'https',
+            'X-Cloud-Trace-Context': '105445aa7843bc8bf206b120001000/1;o=1',
+            'Traceparent': '00-105445aa7843bc8bf206b120001000-0000000000000001-01',
+        }
+    ).get_request(Request)
+
+
+def bench(name, fn, number=20000):
+    request = incoming_request()
+    assert fn(request).status_code == 200
+    seconds = min(timeit.repeat(lambda: fn(request), number=number, repeat=3))
+    print("{:<22} {:>8.1f}us per request".format(
+        name, seconds / number * 1e6))
+    return seconds
+
+
+if __name__ == "__main__":
+    before = bench("test_request_context", test_context_dispatch)
+    after = bench("dispatch", lambda request: dispatch(app, request))
+    print("{:.1f}x faster".format(before / after))
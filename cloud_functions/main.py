@@ -1,2 +1,36 @@
-from api.main import api
-from scrapers.main import scrapers
+import importlib
+import os
+
+# Set IMPORT_PROFILE=1 to log per module import times for the first request
+profiler = None
+if os.environ.get("IMPORT_PROFILE"):
+    from api.ImportProfiler import ImportProfiler
+    budget = os.environ.get("COLD_START_BUDGET_MS")
+    profiler = ImportProfiler(
+        budget_ms=float(budget) if budget else None).install()
+
+
+def _lazy_entry_point(module_name, function_name):
+    # Each function only imports its own code, on its first request
+    # so the api never loads the scrapers (or their dependencies) and vice versa
+    handler = None
+
+    def entry_point(request):
+        nonlocal handler
+        if handler is not None:
+            return handler(request)
+
+        handler = getattr(importlib.import_module(module_name), function_name)
+        response = handler(request)
+
+        if profiler is not None:
+            profiler.report(function_name + " cold start")
+            profiler.uninstall()
+        return response
+
+    entry_point.__name__ = function_name
+    return entry_point
+
+
+api = _lazy_entry_point("api.main", "api")
+scrapers = _lazy_entry_point("scrapers.main", "scrapers")
@@ -1,39 +1,37 @@
 import json
 import os
+import pandas as pd
 from datetime import datetime
 from google.cloud import storage
 from google.cloud import bigquery
 from google.api_core import retry
-from pydoc import locate
+from google.api_core.exceptions import NotFound
 
 stage = os.environ['STAGE']
 
-from scrapers.area_data.utilities.tepco.TepcoAreaScraper import TepcoAreaScraper
-from scrapers.area_data.utilities.kepco.KepcoAreaScraper import KepcoAreaScraper
-from scrapers.area_data.utilities.tohokuden.TohokudenAreaScraper import TohokudenAreaScraper
-from scrapers.area_data.utilities.chuden.ChudenAreaScraper import ChudenAreaScraper
-from scrapers.area_data.utilities.hepco.HepcoAreaScraper import HepcoAreaScraper
-from scrapers.area_data.utilities.rikuden.RikudenAreaScraper import RikudenAreaScraper
-from scrapers.area_data.utilities.cepco.CepcoAreaScraper import CepcoAreaScraper
-from scrapers.area_data.utilities.yonden.YondenAreaScraper import YondenAreaScraper
-from scrapers.area_data.utilities.kyuden.KyudenAreaScraper import KyudenAreaScraper
-from scrapers.area_data.utilities.okiden.OkidenAreaScraper import OkidenAreaScraper
+from api.utilities.UtilityRegistry import UtilityRegistry, utility_apis
+from api.utilities.BigQueryExecutor import executor
+from api.utilities.UtilityAPI import FACTOR_VERSION_LABEL
+from api.cache.shared import data_versions
+
+# Tables that are partitioned (and clustered) on a timestamp column when the scraper replaces them
+#   so the API's date range queries only scan the days they ask for
+PARTITIONED_TABLES = {
+    "historical_data_by_generation_type": "datetime"
+}
+# BigQuery won't let one load job write to more partitions than this, longer histories use monthly partitions
+MAX_PARTITIONS_PER_JOB = 4000
+# Where a table is loaded first when its partitioning has to change, <table>_staging
+STAGING_SUFFIX = "_staging"
+
+# Same lookup as the API, each scraper is only imported and built when first asked for
+area_scrapers = UtilityRegistry(
+    "scrapers.area_data.utilities.{utility}.{Utility}AreaScraper.{Utility}AreaScraper"
+)
 
 
 def selectUtility(utility):
-    utilities = {
-        "tepco": TepcoAreaScraper(),
-        "tohokuden": TohokudenAreaScraper(),
-        "kepco": KepcoAreaScraper(),
-        "chuden": ChudenAreaScraper(),
-        "hepco": HepcoAreaScraper(),
-        "rikuden": RikudenAreaScraper(),
-        "cepco": CepcoAreaScraper(),
-        "yonden": YondenAreaScraper(),
-        "kyuden": KyudenAreaScraper(),
-        "okiden": OkidenAreaScraper(),
-    }
-    return utilities.get(utility, None)
+    return area_scrapers.get(utility)
 
 
 class AreaDataScraper:
@@ -45,6 +43,8 @@ class AreaDataScraper:
         print("Full Scrape and Model of Area Data for {}:".format(self.utility))
         numRows, startDate, endDate = self.get_data()
         self.create_timeseries_model()
+        self.create_intensity_cube()
+        self.publish()
         return numRows, startDate, endDate
 
     def get_data(self):
@@ -57,16 +57,29 @@ class AreaDataScraper:
         print("   - Starting from {}".format(startDate))
         print("   - Ending at {}".format(endDate))
 
+        # Work out each hour's carbon intensity once here, rather than in every API query
+        api = utility_apis.get(self.utility)
+        df = api.calculate_carbon_intensity(df)
+        print(" - Calculated Carbon Intensity")
+
         print("Sending:")
         self._upload_blob_to_storage(df)
         print(" - Sent to Cloud Storage")
 
         self._insert_into_bigquery(
             df, 'historical_data_by_generation_type', 'replace')
+        self._label_table('historical_data_by_generation_type', {
+            FACTOR_VERSION_LABEL: api.factor_version()
+        })
         print(" - Sent to BigQuery")
 
         return numRows, startDate, endDate
 
+    def publish(self):
+        # The API's cached responses for this utility are now out of date
+        #   called once everything a route changes is in place, each publish empties the API's cache
+        data_versions.publish(self.utility)
+
     def _upload_blob_to_storage(self, df):
         CS = storage.Client()
         dateString = datetime.today().strftime('%Y-%m-%d')
@@ -89,23 +102,91 @@ class AreaDataScraper:
 
         table_id = BQ_DATASET + "." + table_name
 
-        df.to_gbq(table_id, if_exists=insertiontype)
+        job_config = bigquery.LoadJobConfig()
+        # Keep every datetime a TIMESTAMP, as to_gbq made them, whether or not it has a timezone
+        job_config.schema = [
+            bigquery.SchemaField(column, "TIMESTAMP")
+            for column in df.columns if pd.api.types.is_datetime64_any_dtype(df[column])
+        ]
+        if insertiontype == 'replace':
+            job_config.write_disposition = bigquery.WriteDisposition.WRITE_TRUNCATE
+            partition_column = PARTITIONED_TABLES.get(table_name)
+            if partition_column is not None:
+                self._partition(job_config, df, partition_column)
+                if self._partitioned_differently(table_id, job_config):
+                    self._replace_repartitioned(df, table_id, job_config)
+                    return
+        else:
+            job_config.write_disposition = bigquery.WriteDisposition.WRITE_APPEND
+
+        executor.load_dataframe(df, table_id, job_config,
+                                label="load " + table_name)
+
+    def _partitioned_differently(self, table_id, job_config):
+        # WRITE_TRUNCATE swaps the data in place, but can't change an existing table's partitioning
+        try:
+            table = executor.client.get_table(table_id)
+        except NotFound:
+            return False
+
+        partitioning = table.time_partitioning
+        wanted = job_config.time_partitioning
+        return partitioning is None or partitioning.type_ != wanted.type_ \
+            or partitioning.field != wanted.field \
+            or table.clustering_fields != job_config.clustering_fields
+
+    def _replace_repartitioned(self, df, table_id, job_config):
+        """
+        Recreate table_id with the new partitioning, e.g. when a history grows past MAX_PARTITIONS_PER_JOB days.
+        The data is loaded into a staging table first, so the table is only missing between
+        dropping it and the copy from staging, which takes seconds rather than the length of a load.
+        """
+        staging_id = table_id + STAGING_SUFFIX
+        print(" - Partitioning of {} changed, recreating it from {}".format(
+            table_id, staging_id))
+        executor.client.delete_table(staging_id, not_found_ok=True)
+        executor.load_dataframe(df, staging_id, job_config,
+                                label="load " + staging_id)
+
+        executor.client.delete_table(table_id, not_found_ok=True)
+        # A copy into a table that doesn't exist keeps the source's partitioning and clustering
+        executor.client.copy_table(staging_id, table_id).result()
+        executor.client.delete_table(staging_id, not_found_ok=True)
+
+    def _label_table(self, table_name, labels):
+        # The API only reads carbon_intensity from tables labelled with the factors it would use
+        table = executor.client.get_table(self.utility + "." + table_name)
+        table.labels = labels
+        executor.client.update_table(table, ["labels"])
+
+    def _partition(self, job_config, df, column):
+        timestamps = df[column]
+        days = (timestamps.max() - timestamps.min()).days + 1
+        partition_type = bigquery.TimePartitioningType.DAY
+        if days > MAX_PARTITIONS_PER_JOB:
+            partition_type = bigquery.TimePartitioningType.MONTH
+
+        job_config.time_partitioning = bigquery.TimePartitioning(
+            type_=partition_type,
+            field=column
+        )
+        # Orders rows inside each partition, so a day out of a monthly partition is still a small read
+        job_config.clustering_fields = [column]
+        print(" - Partitioned by {} on {}".format(partition_type, column))
+
+    def create_intensity_cube(self):
+        print("Creating Intensity Cube")
+        # The API's average breakdowns are all rolled up from this
+        utility_apis.get(self.utility).create_intensity_cube()
+        print(" - Intensity Cube Created")
 
     def create_timeseries_model(self):
         print("Creating Timeseries Model")
-        # Dynamically Pull in the API code
+        # Pull in the API code from the shared registry
         #   this function runs once upon scraping
         #   but all functional data - re: Carbon is in API
         #   this should maybe be changed
-        utilityCaps = self.utility.title() + "API"
-        UtilityAPI = locate(
-            'api.utilities.{utility}.{utilityCaps}.{utilityCaps}'.format(
-                utility=self.utility,
-                utilityCaps=utilityCaps
-            )
-        )
-
-        api = UtilityAPI()
+        api = utility_apis.get(self.utility)
         result = api.create_timeseries_model()
 
         print("Getting ARIMA Timeseries Forecast")
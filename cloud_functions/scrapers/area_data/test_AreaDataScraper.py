@@ -0,0 +1,86 @@
+import pandas as pd
+from types import SimpleNamespace
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+from . import AreaDataScraper as area_data_scraper_module
+from .AreaDataScraper import AreaDataScraper, MAX_PARTITIONS_PER_JOB
+
+TABLE_ID = "tepco.historical_data_by_generation_type"
+
+
+def history(days):
+    return pd.DataFrame({
+        "datetime": pd.date_range("2010-01-01", periods=days, freq="D"),
+        "carbon_intensity": 500.0
+    })
+
+
+def existing_table(partition_type):
+    return SimpleNamespace(
+        time_partitioning=bigquery.TimePartitioning(
+            type_=partition_type, field="datetime"),
+        clustering_fields=["datetime"]
+    )
+
+
+def replace(mocker, df, table):
+    executor = mocker.patch.object(area_data_scraper_module, "executor")
+    if table is None:
+        executor.client.get_table.side_effect = NotFound("missing")
+    else:
+        executor.client.get_table.return_value = table
+
+    AreaDataScraper("tepco")._insert_into_bigquery(
+        df, "historical_data_by_generation_type", "replace")
+    return executor
+
+
+def test_partitioned_by_month_past_the_partition_limit():
+    scraper = AreaDataScraper("tepco")
+    days, months = bigquery.LoadJobConfig(), bigquery.LoadJobConfig()
+
+    scraper._partition(days, history(MAX_PARTITIONS_PER_JOB), "datetime")
+    scraper._partition(months, history(MAX_PARTITIONS_PER_JOB + 1), "datetime")
+
+    assert days.time_partitioning.type_ == bigquery.TimePartitioningType.DAY
+    assert months.time_partitioning.type_ == bigquery.TimePartitioningType.MONTH
+    assert months.clustering_fields == ["datetime"]
+
+
+def test_unchanged_partitioning_is_replaced_in_place(mocker):
+    executor = replace(mocker, history(10),
+                       existing_table(bigquery.TimePartitioningType.DAY))
+
+    executor.client.delete_table.assert_not_called()
+    df, table_id, job_config = executor.load_dataframe.call_args[0]
+    assert table_id == TABLE_ID
+    assert job_config.write_disposition == bigquery.WriteDisposition.WRITE_TRUNCATE
+
+
+def test_missing_table_is_loaded(mocker):
+    executor = replace(mocker, history(10), None)
+
+    executor.client.delete_table.assert_not_called()
+    assert executor.load_dataframe.call_args[0][1] == TABLE_ID
+
+
+def test_changed_partitioning_is_loaded_to_staging_and_copied(mocker):
+    executor = replace(mocker, history(MAX_PARTITIONS_PER_JOB + 1),
+                       existing_table(bigquery.TimePartitioningType.DAY))
+
+    staging = TABLE_ID + "_staging"
+    df, table_id, job_config = executor.load_dataframe.call_args[0]
+    assert table_id == staging
+    assert job_config.time_partitioning.type_ == bigquery.TimePartitioningType.MONTH
+    # The table only goes once the load into staging has finished
+    assert [c[0] for c in executor.method_calls if c[0] != "client.get_table"] == [
+        "client.delete_table",
+        "load_dataframe",
+        "client.delete_table",
+        "client.copy_table",
+        "client.delete_table"
+    ]
+    assert executor.client.copy_table.call_args[0] == (staging, TABLE_ID)
+    executor.client.copy_table.return_value.result.assert_called_once()
+    assert [c[0][0] for c in executor.client.delete_table.call_args_list] == [
+        staging, TABLE_ID, staging]
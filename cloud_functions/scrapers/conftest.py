@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The scrapers are deployed with cloud_functions as the root, and import the API from there as `api`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STAGE", "staging")
@@ -1,10 +1,9 @@
 import json
-import copy
-import werkzeug.datastructures
 from flask import Flask
 app = Flask(__name__)
 
 from scrapers.area_data.AreaDataScraper import AreaDataScraper
+from api.dispatch import dispatch
 
 headers = {}
 
@@ -13,19 +12,7 @@ BAD_UTILITY = 'Invalid Utility Specified'
 
 
 def scrapers(request):
-    with app.app_context():
-        headers = werkzeug.datastructures.Headers()
-        for key, value in request.headers.items():
-            headers.add(key, value)
-        with app.test_request_context(method=request.method, base_url=request.base_url, path=request.path, query_string=request.query_string, headers=headers, data=request.data):
-            try:
-                rv = app.preprocess_request()
-                if rv is None:
-                    rv = app.dispatch_request()
-            except Exception as e:
-                rv = app.handle_user_exception(e)
-            response = app.make_response(rv)
-            return app.process_response(response)
+    return dispatch(app, request)
 
 
 @app.route('/area_data/<utility>')
@@ -59,7 +46,10 @@ def get_data(utility):
     if s.scraper == None:
         return BAD_UTILITY, 400, headers
 
-    numRows = s.get_data()
+    numRows, startDate, endDate = s.get_data()
+    # The API only uses a cube built since the hourly data was replaced
+    s.create_intensity_cube()
+    s.publish()
 
     response = {
         "result": "success",
@@ -79,7 +69,8 @@ def create_model(utility):
     if s.scraper == None:
         return BAD_UTILITY, 400, headers
 
-    numRows = s.create_timeseries_model()
+    s.create_timeseries_model()
+    s.publish()
 
     response = {
         "result": "success",